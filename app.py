@@ -1,21 +1,79 @@
 import streamlit as st
-import sqlite3, os
+import sqlite3, os, threading, queue, csv, tempfile, logging, heapq
 import pandas as pd
 from datetime import datetime, date, time, timedelta
 from io import BytesIO
+from collections import OrderedDict, Counter, deque
+from bisect import bisect_right
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from itertools import islice
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from time import monotonic, perf_counter
 
 # =======================
 # App config
 # =======================
 st.set_page_config(page_title="Departures", page_icon="🚉", layout="wide")
-DB_PATH = "data.db"
+DB_PATH = os.environ.get("DEPARTURES_DB", "data.db")
 
-# --- Auto-refresh svake 3 sekunde (3000 ms) ---
-try:
-    from streamlit_autorefresh import st_autorefresh
-    st_autorefresh(interval=3000, key="live_sync_3s")
-except Exception:
-    pass
+# --- Live osvježavanje svake 3 sekunde: samo fragmenti sa sažetkom i listom, ne cijela skripta ---
+LIVE_REFRESH = "3s"
+
+# =======================
+# Mjerenje – svaki rerun (i samostalni tick fragmenta) dobiva zapis s trajanjem faza i SQL statistikom;
+# naredbe sporije od SLOW_QUERY_MS idu u log i u admin panel (?admin=1 ili DEPARTURES_ADMIN=1)
+# =======================
+SLOW_QUERY_MS = float(os.environ.get("DEPARTURES_SLOW_MS", "100"))
+METRICS_RUNS = 50      # koliko zadnjih reruna pamtimo
+RUN_STMTS_MAX = 200    # naredbi po zapisu reruna
+log = logging.getLogger("departures")
+
+@st.cache_resource(show_spinner=False)
+def _metrics():
+    return {"runs": deque(maxlen=METRICS_RUNS), "slow": deque(maxlen=METRICS_RUNS), "local": threading.local()}
+
+# isti thread-local u svim rerunovima – konekcije iz poola nadžive modul u kojem su nastale
+_local = _metrics()["local"]
+
+def begin_run(kind: str, first: str | None = None):
+    # rerun prekinut s st.rerun() ne dođe do end_run – bilježi se do točke prekida
+    if getattr(_local, "run", None) is not None: end_run()
+    now = perf_counter()
+    _local.run = {"kind": kind, "at": datetime.now().strftime("%H:%M:%S"), "t0": now, "phase": (first or kind, now),
+                  "spans": {}, "queries": 0, "db_ms": 0.0, "rows": 0, "stmts": []}
+
+def phase(name: str | None):
+    # zatvara tekuću fazu i otvara sljedeću – faze se nižu, zbroj im je trajanje cijelog reruna
+    run = getattr(_local, "run", None)
+    if run is None: return
+    now = perf_counter(); prev, t0 = run["phase"]
+    run["spans"][prev] = run["spans"].get(prev, 0.0) + (now - t0) * 1e3
+    run["phase"] = (name, now)
+
+def end_run():
+    run = getattr(_local, "run", None)
+    if run is None: return
+    phase(None); _local.run = None
+    run["ms"] = (perf_counter() - run.pop("t0")) * 1e3; del run["phase"]
+    _metrics()["runs"].append(run)
+
+def traced(name: str):
+    # unutar reruna samo otvara fazu; tick fragmenta ili klik na download dobiva vlastiti zapis
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "run", None) is not None:
+                phase(name); return fn(*args, **kwargs)
+            begin_run(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end_run()
+        return wrapper
+    return deco
+
+begin_run("rerun", "setup")
 
 # =======================
 # i18n (EN / NO)
@@ -37,15 +95,35 @@ TXT = {
         "validation": "⚠️ Fill all required fields.",
         "duplicate": "⚠️ Same Unit+Time+Destination already exists for this day.",
         "export_csv":"Export CSV", "export_xlsx":"Export Excel", "export_pdf":"Export PDF",
-        "count_title":"Summary", "total":"Total", "train_count":"Train", "car_count":"Car",
+        "range_export":"📅 Export date range", "range_from":"From", "range_to":"To",
+        "range_format":"Format", "range_download":"Download",
+        "count_title":"Summary", "breakdown":"Per destination", "total":"Total", "train_count":"Train", "car_count":"Car",
         "save_changes":"Save Edit",
         "service_date":"Service date", "today":"Today", "prev_day":"◀ Yesterday",
         "search_unit":"Quick search",
+        "search_scope":"Search in", "scope_day":"Selected day", "scope_month":"Last 31 days", "scope_all":"All dates",
+        "search_results":"Search results ({n})",
+        "page_size":"Rows per page", "prev_page":"◀ Previous", "next_page":"Next ▶",
+        "page_info":"Page {page} · {start}–{end} of {total}",
         "empty_export":"Nothing to export.",
         "gate_digits_live":"⚠️ Gate must contain digits only.",
         "gate_digits_block":"⚠️ Gate must be a number.",
         "menu_more":"⋯",
         "auto_refresh_note":"Auto-refresh every 3s enabled.",
+        "import":"📥 Import schedule", "import_file":"CSV or Excel file", "import_run":"Import",
+        "import_help":"Columns: Unit, Gate, Time, Transport, Destination, Comment (optional), Date (optional, default = selected day).",
+        "import_done":"✅ Imported {n} rows", "import_rejects":"⚠️ {n} rows rejected",
+        "import_row":"Row", "import_reason":"Reason",
+        "bad_time":"Invalid time", "bad_date":"Invalid date", "bad_dest":"Unknown destination",
+        "bad_transport":"Transport must be Train or Car", "bad_file":"File could not be read",
+        "archived":"🗄️ This date is archived and read-only.",
+        "busy":"⏳ The database is busy – nothing was saved. Please try again.",
+        "analytics":"📊 Analytics", "an_hour":"Departures per hour", "an_dest":"Per destination",
+        "an_mix":"Train vs car", "an_gate":"Gate utilization", "an_week":"Weekly trend",
+        "an_n":"Departures", "an_hour_axis":"Hour", "an_week_axis":"Week (Monday)",
+        "diagnostics":"🛠 Diagnostics", "diag_runs":"Recent reruns (ms)", "diag_cache":"Cache hit rate",
+        "diag_slow":"Slow queries (≥ {ms:g} ms)", "diag_stmts":"Slowest statements, last rerun",
+        "diag_tiers":"Archive: {months} months · {rows} rows · hot: {hot} rows",
     },
     "Norsk": {
         "title": "🚉 Avganger",
@@ -62,15 +140,35 @@ TXT = {
         "validation": "⚠️ Fyll ut alle påkrevde felt.",
         "duplicate": "⚠️ Samme enhet+tid+destinasjon finnes allerede for dagen.",
         "export_csv":"Eksporter CSV", "export_xlsx":"Eksporter Excel", "export_pdf":"Eksporter PDF",
-        "count_title":"Oppsummering", "total":"Totalt", "train_count":"Tog", "car_count":"Bil",
+        "range_export":"📅 Eksporter periode", "range_from":"Fra", "range_to":"Til",
+        "range_format":"Format", "range_download":"Last ned",
+        "count_title":"Oppsummering", "breakdown":"Per destinasjon", "total":"Totalt", "train_count":"Tog", "car_count":"Bil",
         "save_changes":"Lagre endring",
         "service_date":"Dato", "today":"I dag", "prev_day":"◀ I går",
         "search_unit":"Hurtigsøk",
+        "search_scope":"Søk i", "scope_day":"Valgt dag", "scope_month":"Siste 31 dager", "scope_all":"Alle datoer",
+        "search_results":"Søkeresultater ({n})",
+        "page_size":"Rader per side", "prev_page":"◀ Forrige", "next_page":"Neste ▶",
+        "page_info":"Side {page} · {start}–{end} av {total}",
         "empty_export":"Ingenting å eksportere.",
         "gate_digits_live":"⚠️ Luke må kun inneholde tall.",
         "gate_digits_block":"⚠️ Luke må være et tall.",
         "menu_more":"⋯",
         "auto_refresh_note":"Auto-oppdatering hvert 3s er aktiv.",
+        "import":"📥 Importer ruteplan", "import_file":"CSV- eller Excel-fil", "import_run":"Importer",
+        "import_help":"Kolonner: Enhet, Luke, Tid, Transport, Destinasjon, Kommentar (valgfri), Dato (valgfri, standard = valgt dag).",
+        "import_done":"✅ Importerte {n} rader", "import_rejects":"⚠️ {n} rader avvist",
+        "import_row":"Rad", "import_reason":"Årsak",
+        "bad_time":"Ugyldig tid", "bad_date":"Ugyldig dato", "bad_dest":"Ukjent destinasjon",
+        "bad_transport":"Transport må være Tog eller Bil", "bad_file":"Filen kunne ikke leses",
+        "archived":"🗄️ Denne datoen er arkivert og skrivebeskyttet.",
+        "busy":"⏳ Databasen er opptatt – ingenting ble lagret. Prøv igjen.",
+        "analytics":"📊 Analyse", "an_hour":"Avganger per time", "an_dest":"Per destinasjon",
+        "an_mix":"Tog vs bil", "an_gate":"Lukebruk", "an_week":"Ukentlig trend",
+        "an_n":"Avganger", "an_hour_axis":"Time", "an_week_axis":"Uke (mandag)",
+        "diagnostics":"🛠 Diagnostikk", "diag_runs":"Siste kjøringer (ms)", "diag_cache":"Cache-treff",
+        "diag_slow":"Trege spørringer (≥ {ms:g} ms)", "diag_stmts":"Tregeste spørringer, siste kjøring",
+        "diag_tiers":"Arkiv: {months} måneder · {rows} rader · aktiv: {hot} rader",
     }
 }[LANG]
 
@@ -136,92 +234,904 @@ inject_css()
 # =======================
 # DB
 # =======================
-def db():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+DB_READERS = 4  # broj reader konekcija u poolu; writer je uvijek jedan
+
+def _record_stmt(stat):
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run["queries"] += 1; run["db_ms"] += stat["ms"]; run["rows"] += stat["rows"]
+        if len(run["stmts"]) < RUN_STMTS_MAX: run["stmts"].append(stat)
+    if stat["ms"] >= SLOW_QUERY_MS:
+        sql = " ".join(stat["sql"].split())
+        _metrics()["slow"].append({"at": datetime.now().strftime("%H:%M:%S"), "run": run["kind"] if run else "-",
+                                   "ms": stat["ms"], "rows": stat["rows"], "sql": sql})
+        log.warning("slow query %.1f ms, %d rows: %s", stat["ms"], stat["rows"], sql)
+
+class _TimedCursor(sqlite3.Cursor):
+    # trajanje naredbe = execute + svi fetchevi; bilježi se kad je rezultat pročitan do kraja
+    _stat = None
+
+    def _add(self, n, t0, done):
+        stat = self._stat
+        if stat is None: return
+        stat["ms"] += (perf_counter() - t0) * 1e3; stat["rows"] += n
+        if done: self._stat = None; _record_stmt(stat)
+
+    def execute(self, sql, params=()):
+        t0 = perf_counter(); super().execute(sql, params)
+        self._stat = {"sql": sql, "ms": 0.0, "rows": 0}
+        dml = self.description is None
+        self._add(max(self.rowcount, 0) if dml else 0, t0, dml)
+        return self
+
+    def executemany(self, sql, seq):
+        t0 = perf_counter(); super().executemany(sql, seq)
+        self._stat = {"sql": sql, "ms": 0.0, "rows": 0}
+        self._add(max(self.rowcount, 0), t0, True)
+        return self
+
+    def fetchone(self):
+        t0 = perf_counter(); row = super().fetchone()
+        self._add(row is not None, t0, True)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        t0 = perf_counter(); rows = super().fetchmany(size)
+        self._add(len(rows), t0, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        t0 = perf_counter(); rows = super().fetchall()
+        self._add(len(rows), t0, True)
+        return rows
+
+    def __next__(self):
+        t0 = perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(0, t0, True); raise
+        self._add(1, t0, False)
+        return row
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+def _connect():
+    con = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=5, cached_statements=256,
+                          factory=_TimedConnection)
+    con.execute("PRAGMA journal_mode=WAL")       # readeri ne čekaju writera
+    con.execute("PRAGMA synchronous=NORMAL")     # u WAL-u dovoljno sigurno, bez fsync-a na svaki commit
+    con.execute("PRAGMA busy_timeout=5000")
+    con.execute("PRAGMA mmap_size=268435456")
+    con.execute("PRAGMA cache_size=-16000")
+    con.execute("PRAGMA temp_store=MEMORY")
+    return con
+
+@st.cache_resource(show_spinner=False)
+def _pool():
+    readers = queue.LifoQueue()
+    for _ in range(DB_READERS): readers.put(_connect())
+    return {"readers": readers, "writer": _connect(), "wlock": threading.Lock()}
+
+@contextmanager
+def reader():
+    pool = _pool(); con = pool["readers"].get()
+    try:
+        yield con
+    finally:
+        if con.in_transaction: con.rollback()
+        pool["readers"].put(con)
+
+@contextmanager
+def writer():
+    # jedan writer, serijaliziran lockom; commit na izlazu, rollback na iznimku
+    pool = _pool()
+    with pool["wlock"], pool["writer"] as con:
+        yield con
+
+COLS = ("id", "service_date", "unit_number", "gate", "departure_time",
+        "transport_type", "destination", "comment", "created_at")
+SELECT_COLS = ", ".join(COLS)
+
+# =======================
+# Migracije – verzija sheme u PRAGMA user_version, svaka migracija u svojoj transakciji
+# =======================
+MIGRATIONS = [
+    # 1: osnovna tablica
+    """
+    CREATE TABLE IF NOT EXISTS departures (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        service_date TEXT NOT NULL,
+        unit_number TEXT NOT NULL,
+        gate INTEGER NOT NULL,
+        departure_time TEXT NOT NULL,
+        transport_type TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        comment TEXT,
+        created_at TEXT NOT NULL
+    );
+    """,
+    # 2: change-log – svaka promjena dobije novi rev (monotono raste), puni ga trigger
+    """
+    CREATE TABLE IF NOT EXISTS change_log (
+        rev INTEGER PRIMARY KEY AUTOINCREMENT,
+        row_id INTEGER NOT NULL,
+        service_date TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_change_log_day ON change_log(service_date, rev);
+    CREATE TRIGGER IF NOT EXISTS trg_departures_ins AFTER INSERT ON departures BEGIN
+        INSERT INTO change_log(row_id, service_date) VALUES (NEW.id, NEW.service_date);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_departures_upd AFTER UPDATE ON departures BEGIN
+        INSERT INTO change_log(row_id, service_date) VALUES (NEW.id, NEW.service_date);
+        INSERT INTO change_log(row_id, service_date)
+            SELECT OLD.id, OLD.service_date WHERE OLD.service_date<>NEW.service_date;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_departures_del AFTER DELETE ON departures BEGIN
+        INSERT INTO change_log(row_id, service_date) VALUES (OLD.id, OLD.service_date);
+    END;
+    """,
+    # 3: indeksi za dnevne upite + normalizirani unit s unique indeksom (zamjenjuje SELECT-pa-INSERT provjeru).
+    #    Postojeći duplikati se ne brišu nego premjeste u departures_dups.
+    f"""
+    ALTER TABLE departures ADD COLUMN unit_norm TEXT GENERATED ALWAYS AS (UPPER(TRIM(unit_number))) VIRTUAL;
+    CREATE TABLE departures_dups AS SELECT {SELECT_COLS} FROM departures WHERE 0;
+    INSERT INTO departures_dups
+        SELECT {SELECT_COLS} FROM departures WHERE id NOT IN
+            (SELECT MIN(id) FROM departures GROUP BY service_date, unit_norm, departure_time, destination);
+    DELETE FROM departures WHERE id IN (SELECT id FROM departures_dups);
+    CREATE UNIQUE INDEX ux_departures_slot ON departures(service_date, unit_norm, departure_time, destination);
+    CREATE INDEX ix_departures_day_time ON departures(service_date, departure_time, destination);
+    CREATE INDEX ix_departures_day_dest ON departures(service_date, destination, departure_time);
+    """,
+    # 4: dnevni brojači – triggeri ih drže točnima u istoj transakciji kao i sam zapis
+    """
+    CREATE TABLE daily_summary (
+        service_date TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        trains INTEGER NOT NULL DEFAULT 0,
+        cars INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE TABLE daily_breakdown (
+        service_date TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        transport_type TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (service_date, destination, transport_type)
+    ) WITHOUT ROWID;
+    INSERT INTO daily_summary
+        SELECT service_date, COUNT(*), SUM(transport_type='Train'), SUM(transport_type='Car')
+        FROM departures GROUP BY service_date;
+    INSERT INTO daily_breakdown
+        SELECT service_date, destination, transport_type, COUNT(*)
+        FROM departures GROUP BY service_date, destination, transport_type;
+    CREATE TRIGGER trg_summary_ins AFTER INSERT ON departures BEGIN
+        INSERT INTO daily_summary VALUES (NEW.service_date, 1, NEW.transport_type='Train', NEW.transport_type='Car')
+            ON CONFLICT(service_date) DO UPDATE
+            SET total=total+1, trains=trains+excluded.trains, cars=cars+excluded.cars;
+        INSERT INTO daily_breakdown VALUES (NEW.service_date, NEW.destination, NEW.transport_type, 1)
+            ON CONFLICT(service_date, destination, transport_type) DO UPDATE SET n=n+1;
+    END;
+    CREATE TRIGGER trg_summary_del AFTER DELETE ON departures BEGIN
+        UPDATE daily_summary
+            SET total=total-1, trains=trains-(OLD.transport_type='Train'), cars=cars-(OLD.transport_type='Car')
+            WHERE service_date=OLD.service_date;
+        DELETE FROM daily_summary WHERE service_date=OLD.service_date AND total<=0;
+        UPDATE daily_breakdown SET n=n-1
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type;
+        DELETE FROM daily_breakdown
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type AND n<=0;
+    END;
+    CREATE TRIGGER trg_summary_upd AFTER UPDATE OF service_date, destination, transport_type ON departures BEGIN
+        UPDATE daily_summary
+            SET total=total-1, trains=trains-(OLD.transport_type='Train'), cars=cars-(OLD.transport_type='Car')
+            WHERE service_date=OLD.service_date;
+        DELETE FROM daily_summary WHERE service_date=OLD.service_date AND total<=0;
+        UPDATE daily_breakdown SET n=n-1
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type;
+        DELETE FROM daily_breakdown
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type AND n<=0;
+        INSERT INTO daily_summary VALUES (NEW.service_date, 1, NEW.transport_type='Train', NEW.transport_type='Car')
+            ON CONFLICT(service_date) DO UPDATE
+            SET total=total+1, trains=trains+excluded.trains, cars=cars+excluded.cars;
+        INSERT INTO daily_breakdown VALUES (NEW.service_date, NEW.destination, NEW.transport_type, 1)
+            ON CONFLICT(service_date, destination, transport_type) DO UPDATE SET n=n+1;
+    END;
+    """,
+    # 5: FTS5 trigram indeks nad unit_number i comment (substring/prefix pretraga bez skeniranja), treba SQLite >= 3.34
+    """
+    CREATE VIRTUAL TABLE departures_fts USING fts5(
+        unit_number, comment, content='departures', content_rowid='id', tokenize='trigram'
+    );
+    INSERT INTO departures_fts(departures_fts) VALUES ('rebuild');
+    CREATE TRIGGER trg_fts_ins AFTER INSERT ON departures BEGIN
+        INSERT INTO departures_fts(rowid, unit_number, comment) VALUES (NEW.id, NEW.unit_number, NEW.comment);
+    END;
+    CREATE TRIGGER trg_fts_del AFTER DELETE ON departures BEGIN
+        INSERT INTO departures_fts(departures_fts, rowid, unit_number, comment)
+            VALUES ('delete', OLD.id, OLD.unit_number, OLD.comment);
+    END;
+    CREATE TRIGGER trg_fts_upd AFTER UPDATE OF unit_number, comment ON departures BEGIN
+        INSERT INTO departures_fts(departures_fts, rowid, unit_number, comment)
+            VALUES ('delete', OLD.id, OLD.unit_number, OLD.comment);
+        INSERT INTO departures_fts(rowid, unit_number, comment) VALUES (NEW.id, NEW.unit_number, NEW.comment);
+    END;
+    """,
+    # 6: hot/cold – stari mjeseci se sele u arhivske baze; brisanje pri selidbi nije promjena podataka,
+    #    pa change_log i dnevni brojači preskaču redove arhiviranih mjeseci
+    """
+    CREATE TABLE archive_months (
+        month TEXT PRIMARY KEY,
+        file TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    ) WITHOUT ROWID;
+    DROP TRIGGER trg_departures_del;
+    CREATE TRIGGER trg_departures_del AFTER DELETE ON departures
+    WHEN NOT EXISTS (SELECT 1 FROM archive_months WHERE month=substr(OLD.service_date, 1, 7)) BEGIN
+        INSERT INTO change_log(row_id, service_date) VALUES (OLD.id, OLD.service_date);
+    END;
+    DROP TRIGGER trg_summary_del;
+    CREATE TRIGGER trg_summary_del AFTER DELETE ON departures
+    WHEN NOT EXISTS (SELECT 1 FROM archive_months WHERE month=substr(OLD.service_date, 1, 7)) BEGIN
+        UPDATE daily_summary
+            SET total=total-1, trains=trains-(OLD.transport_type='Train'), cars=cars-(OLD.transport_type='Car')
+            WHERE service_date=OLD.service_date;
+        DELETE FROM daily_summary WHERE service_date=OLD.service_date AND total<=0;
+        UPDATE daily_breakdown SET n=n-1
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type;
+        DELETE FROM daily_breakdown
+            WHERE service_date=OLD.service_date AND destination=OLD.destination AND transport_type=OLD.transport_type AND n<=0;
+    END;
+    """,
+    # 7: rollupi za analitiku – po danu i satu, po danu i luci; uz daily_breakdown pokrivaju sve grafove.
+    #    Arhivirani mjeseci se pune iz arhiva nakon migracije (ATTACH ne ide unutar transakcije) – vidi rollup_backfill.
+    """
+    CREATE TABLE rollup_hour (
+        service_date TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (service_date, hour)
+    ) WITHOUT ROWID;
+    CREATE TABLE rollup_gate (
+        service_date TEXT NOT NULL,
+        gate INTEGER NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (service_date, gate)
+    ) WITHOUT ROWID;
+    CREATE TABLE rollup_backfill (month TEXT PRIMARY KEY) WITHOUT ROWID;
+    INSERT INTO rollup_backfill SELECT month FROM archive_months;
+    INSERT INTO rollup_hour
+        SELECT service_date, CAST(substr(departure_time, 1, 2) AS INTEGER), COUNT(*) FROM departures GROUP BY 1, 2;
+    INSERT INTO rollup_gate SELECT service_date, gate, COUNT(*) FROM departures GROUP BY 1, 2;
+    CREATE TRIGGER trg_rollup_ins AFTER INSERT ON departures BEGIN
+        INSERT INTO rollup_hour VALUES (NEW.service_date, CAST(substr(NEW.departure_time, 1, 2) AS INTEGER), 1)
+            ON CONFLICT(service_date, hour) DO UPDATE SET n=n+1;
+        INSERT INTO rollup_gate VALUES (NEW.service_date, NEW.gate, 1)
+            ON CONFLICT(service_date, gate) DO UPDATE SET n=n+1;
+    END;
+    CREATE TRIGGER trg_rollup_del AFTER DELETE ON departures
+    WHEN NOT EXISTS (SELECT 1 FROM archive_months WHERE month=substr(OLD.service_date, 1, 7)) BEGIN
+        UPDATE rollup_hour SET n=n-1
+            WHERE service_date=OLD.service_date AND hour=CAST(substr(OLD.departure_time, 1, 2) AS INTEGER);
+        DELETE FROM rollup_hour
+            WHERE service_date=OLD.service_date AND hour=CAST(substr(OLD.departure_time, 1, 2) AS INTEGER) AND n<=0;
+        UPDATE rollup_gate SET n=n-1 WHERE service_date=OLD.service_date AND gate=OLD.gate;
+        DELETE FROM rollup_gate WHERE service_date=OLD.service_date AND gate=OLD.gate AND n<=0;
+    END;
+    CREATE TRIGGER trg_rollup_upd AFTER UPDATE OF service_date, departure_time, gate ON departures BEGIN
+        UPDATE rollup_hour SET n=n-1
+            WHERE service_date=OLD.service_date AND hour=CAST(substr(OLD.departure_time, 1, 2) AS INTEGER);
+        DELETE FROM rollup_hour
+            WHERE service_date=OLD.service_date AND hour=CAST(substr(OLD.departure_time, 1, 2) AS INTEGER) AND n<=0;
+        UPDATE rollup_gate SET n=n-1 WHERE service_date=OLD.service_date AND gate=OLD.gate;
+        DELETE FROM rollup_gate WHERE service_date=OLD.service_date AND gate=OLD.gate AND n<=0;
+        INSERT INTO rollup_hour VALUES (NEW.service_date, CAST(substr(NEW.departure_time, 1, 2) AS INTEGER), 1)
+            ON CONFLICT(service_date, hour) DO UPDATE SET n=n+1;
+        INSERT INTO rollup_gate VALUES (NEW.service_date, NEW.gate, 1)
+            ON CONFLICT(service_date, gate) DO UPDATE SET n=n+1;
+    END;
+    """,
+]
 
 def init_db():
-    with db() as con:
-        con.execute("""
-        CREATE TABLE IF NOT EXISTS departures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            service_date TEXT NOT NULL,
-            unit_number TEXT NOT NULL,
-            gate INTEGER NOT NULL,
-            departure_time TEXT NOT NULL,
-            transport_type TEXT NOT NULL,
-            destination TEXT NOT NULL,
-            comment TEXT,
-            created_at TEXT NOT NULL
-        )
-        """)
+    with writer() as con:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for v, sql in enumerate(MIGRATIONS[version:], start=version + 1):
+            con.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version={v};\nCOMMIT;")
 init_db()
 
+def data_revision() -> int:
+    # jeftina provjera "je li se išta promijenilo?" – MAX po INTEGER PRIMARY KEY je O(1)
+    with reader() as con:
+        return con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log").fetchone()[0]
+
+def day_revision(day: str) -> int:
+    # zadnja promjena jednog dana (indeks change_log(service_date, rev))
+    with reader() as con:
+        return con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log WHERE service_date=?", (day,)).fetchone()[0]
+
+# =======================
+# Arhiva (hot/cold) – mjeseci starije od ARCHIVE_AFTER_DAYS sele se u data_archive/departures_YYYY-MM.db.
+# Arhivirani mjeseci su samo za čitanje; upiti po service_date same biraju tier (ATTACH po potrebi).
+# Dnevni brojači ostaju u glavnoj bazi, pa sažetak ne ovisi o tieru.
+# =======================
+ARCHIVE_AFTER_DAYS = int(os.environ.get("DEPARTURES_ARCHIVE_DAYS", "90"))  # 0 = bez arhiviranja
+ARCHIVE_DIR = os.environ.get("DEPARTURES_ARCHIVE_DIR", os.path.splitext(DB_PATH)[0] + "_archive")
+MAINTENANCE_EVERY = float(os.environ.get("DEPARTURES_MAINTENANCE_S", "3600"))
+VACUUM_FREE_RATIO = 0.2  # VACUUM tek kad je barem toliki dio stranica prazan
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS arch.departures (
+    id INTEGER PRIMARY KEY,
+    service_date TEXT NOT NULL,
+    unit_number TEXT NOT NULL,
+    gate INTEGER NOT NULL,
+    departure_time TEXT NOT NULL,
+    transport_type TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    comment TEXT,
+    created_at TEXT NOT NULL,
+    unit_norm TEXT GENERATED ALWAYS AS (UPPER(TRIM(unit_number))) VIRTUAL
+);
+CREATE INDEX IF NOT EXISTS arch.ix_departures_day_time ON departures(service_date, departure_time, destination);
+CREATE VIRTUAL TABLE IF NOT EXISTS arch.departures_fts USING fts5(
+    unit_number, comment, content='departures', content_rowid='id', tokenize='trigram'
+);
+"""
+
+@contextmanager
+def attached(con, file: str):
+    con.execute("ATTACH DATABASE ? AS arch", (os.path.join(ARCHIVE_DIR, file),))
+    try:
+        yield con
+    finally:
+        if con.in_transaction: con.rollback()  # DETACH ne ide usred transakcije
+        con.execute("DETACH DATABASE arch")
+
+def archive_file(con, day: str) -> str | None:
+    row = con.execute("SELECT file FROM archive_months WHERE month=?", (day[:7],)).fetchone()
+    return row[0] if row else None
+
+@contextmanager
+def tier_read(con, day: str):
+    # read transakcija nad oba tiera mjeseca tog dana; daje ime arhive (ATTACH-ana kao "arch") ili None.
+    # ATTACH ne ide unutar transakcije, pa se stanje arhive provjeri još jednom nakon BEGIN-a;
+    # ako se mjesec u međuvremenu arhivirao, kreće se ispočetka s arhivom.
+    file = archive_file(con, day)
+    while True:
+        with attached(con, file) if file else nullcontext():
+            con.execute("BEGIN")
+            try:
+                if (now := archive_file(con, day)) == file:
+                    yield file
+                    return
+            finally:
+                if con.in_transaction: con.rollback()
+        file = now
+
+def _day_rows(con, day: str) -> tuple:
+    # rev + redovi oba tiera iz iste read transakcije
+    with tier_read(con, day) as file:
+        rev = con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log").fetchone()[0]
+        sql = f"SELECT {SELECT_COLS} FROM {{db}}.departures WHERE service_date=?"
+        rows = con.execute(sql.format(db="arch"), (day,)).fetchall() if file else []
+        rows += con.execute(sql.format(db="main"), (day,)).fetchall()
+    return rev, list({r[0]: r for r in rows}.values())  # isti id u oba tiera -> hot red pobjeđuje
+
+def _archive_month(month: str) -> bool:
+    # 1) kopija u arhivu i commit; 2) u glavnoj bazi: provjera da je sve stiglo, upis u archive_months, brisanje.
+    # Transakcija preko dvije WAL baze nije atomska, zato dva koraka: pad između ostavlja višak u arhivi, nikad gubitak.
+    # Taj višak se baca na idućem pokušaju – inače bi redovi obrisani ili premješteni u međuvremenu uskrsnuli.
+    file, lo, hi = f"departures_{month}.db", f"{month}-01", f"{month}-31"
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with writer() as con, attached(con, file):
+        con.executescript(ARCHIVE_SCHEMA)
+        con.execute("BEGIN IMMEDIATE")
+        if archive_file(con, lo) is None:
+            con.execute("DELETE FROM arch.departures WHERE service_date BETWEEN ? AND ?", (lo, hi))
+        con.execute(f"""INSERT OR REPLACE INTO arch.departures({SELECT_COLS})
+                        SELECT {SELECT_COLS} FROM main.departures WHERE service_date BETWEEN ? AND ?""", (lo, hi))
+        con.execute("INSERT INTO arch.departures_fts(departures_fts) VALUES ('rebuild')")
+        con.execute("COMMIT")
+        con.execute("BEGIN IMMEDIATE")
+        missing = con.execute(f"""SELECT COUNT(*) FROM (
+                                      SELECT {SELECT_COLS} FROM main.departures WHERE service_date BETWEEN ? AND ?
+                                      EXCEPT SELECT {SELECT_COLS} FROM arch.departures)""", (lo, hi)).fetchone()[0]
+        if missing:  # u međuvremenu je netko (drugi proces) pisao u taj mjesec – idući put
+            con.execute("ROLLBACK"); return False
+        n = con.execute("SELECT COUNT(*) FROM arch.departures WHERE service_date BETWEEN ? AND ?", (lo, hi)).fetchone()[0]
+        con.execute("INSERT OR REPLACE INTO archive_months VALUES (?,?,?,?)",
+                    (month, file, n, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        con.execute("DELETE FROM main.departures WHERE service_date BETWEEN ? AND ?", (lo, hi))
+        con.execute("COMMIT")
+    invalidate_days([f"{month}-{d:02d}" for d in range(1, 32)])  # is_archived je po danu u cacheu
+    return True
+
+def archive_old(after_days: int = ARCHIVE_AFTER_DAYS) -> list:
+    # seli cijele mjesece čiji je zadnji dan stariji od horizonta
+    if after_days <= 0: return []
+    cutoff = (date.today() - timedelta(days=after_days)).strftime("%Y-%m-01")
+    with reader() as con:
+        months = [r[0] for r in con.execute(
+            "SELECT DISTINCT substr(service_date, 1, 7) FROM departures WHERE service_date < ? ORDER BY 1", (cutoff,))]
+    return [m for m in months if _archive_month(m)]
+
+def run_maintenance():
+    months = archive_old()
+    with writer() as con:
+        con.execute("ANALYZE")
+        pages = con.execute("PRAGMA page_count").fetchone()[0]
+        free = con.execute("PRAGMA freelist_count").fetchone()[0]
+        if free > VACUUM_FREE_RATIO * pages:
+            con.execute("VACUUM"); con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if months: log.info("archived months: %s", ", ".join(months))
+
+def _maintenance_loop(stop):
+    while not stop.wait(MAINTENANCE_EVERY):
+        try:
+            run_maintenance()
+        except Exception:
+            log.exception("maintenance failed")
+
+@st.cache_resource(show_spinner=False)
+def _maintenance():
+    stop = threading.Event()
+    threading.Thread(target=_maintenance_loop, args=(stop,), name="departures-maintenance", daemon=True).start()
+    return stop
+_maintenance()
+
+def archive_stats() -> tuple:
+    with reader() as con:
+        months, rows = con.execute("SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM archive_months").fetchone()
+        hot = con.execute("SELECT COALESCE(SUM(total), 0) FROM daily_summary").fetchone()[0] - rows
+    return months, rows, hot
+
+# =======================
+# Snapshot store – jedan snapshot po danu za cijeli proces (sve sesije čitaju isti).
+# Stupčasti DataFrame (kategorije za ponavljajuće stringove) + unaprijed sortirani pogledi za oba poretka;
+# filtriranje, sortiranje i stranice idu iz memorije, baza se čita samo za promijenjene redove.
+# =======================
+DAY_STORE_MAX = 14  # koliko dana držimo u memoriji (LRU)
+SORTS = {
+    "time": ("departure_time", "destination", "id"),
+    "dest": ("destination", "departure_time", "id"),
+}
+
+@st.cache_resource(show_spinner=False)
+def _day_store():
+    return {"lock": threading.Lock(), "days": OrderedDict(), "day_locks": {}, "hits": 0, "misses": 0}
+
+def _fetch_ids(con, day, ids):
+    ids = list(ids)
+    for i in range(0, len(ids), 500):
+        part = ids[i:i+500]
+        yield from con.execute(
+            f"SELECT {SELECT_COLS} FROM departures WHERE service_date=? AND id IN ({','.join('?'*len(part))})",
+            (day, *part))
+
+def _build_snapshot(rev: int, df: pd.DataFrame) -> dict:
+    df = df.astype({"service_date": "category", "destination": "category", "transport_type": "category"})
+    views = {s: df.sort_values(list(keys), kind="stable", ignore_index=True) for s, keys in SORTS.items()}
+    return {"rev": rev, "views": views}
+
+def _patch_snapshot(con, day: str, snap: dict) -> dict:
+    # krpaju se samo redovi promijenjeni od snap["rev"]; rev i redovi iz iste read transakcije
+    con.execute("BEGIN")
+    rev = con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log").fetchone()[0]
+    changed = {r[0] for r in con.execute(
+        "SELECT row_id FROM change_log WHERE service_date=? AND rev>?", (day, snap["rev"]))}
+    if not changed: return {**snap, "rev": rev}
+    df = snap["views"]["time"]
+    df = df[~df["id"].isin(changed)].astype({"service_date": str, "destination": str, "transport_type": str})
+    fresh = pd.DataFrame(list(_fetch_ids(con, day, changed)), columns=COLS)
+    return _build_snapshot(rev, pd.concat([df, fresh], ignore_index=True) if len(fresh) else df)
+
+def day_snapshot(day: str) -> dict:
+    # Zapis ne dira snapshot (commit ostaje brz); zastarjelost se provjerava ovdje, na čitanju – jedan indeksni
+    # lookup u change_log-u – i krpa se pod lockom tog dana, pa ostali dani i writer ne čekaju.
+    store = _day_store()
+    with store["lock"]:
+        snap = store["days"].get(day)
+        if snap is not None: store["days"].move_to_end(day)
+        day_lock = store["day_locks"].setdefault(day, threading.Lock())
+    if snap is not None and day_revision(day) <= snap["rev"]:
+        with store["lock"]: store["hits"] += 1
+        return snap
+    with day_lock:
+        with store["lock"]: snap = store["days"].get(day)
+        with reader() as con:
+            if snap is None:
+                rev, rows = _day_rows(con, day)
+                snap = _build_snapshot(rev, pd.DataFrame(rows, columns=COLS))
+            elif con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log WHERE service_date=?",
+                             (day,)).fetchone()[0] > snap["rev"]:
+                snap = _patch_snapshot(con, day, snap)  # inače ga je već zakrpao thread koji je čekao prije nas
+        with store["lock"]:
+            store["misses"] += 1
+            store["days"][day] = snap; store["days"].move_to_end(day)
+            while len(store["days"]) > DAY_STORE_MAX:
+                old, _ = store["days"].popitem(last=False); store["day_locks"].pop(old, None)
+    return snap
+
 # =======================
-# Cache helpers (TTL=2s → svježe za multi-device)
+# Cache helpers – LRU po (funkcija, dan, argumenti); zapis briše samo unose pogođenih dana
 # =======================
-@st.cache_data(show_spinner=False, ttl=2)
+CACHE_MAX_ENTRIES = 1024
+
+@st.cache_resource(show_spinner=False)
+def _query_cache():
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "by_day": {}, "gen": {}, "rev": data_revision(),
+            "hits": Counter(), "misses": Counter()}
+
+def day_cached(fn):
+    @wraps(fn)
+    def wrapper(day, *args):
+        cache, key = _query_cache(), (fn.__name__, day, *args)
+        with cache["lock"]:
+            if key in cache["entries"]:
+                cache["hits"][fn.__name__] += 1
+                cache["entries"].move_to_end(key)
+                return cache["entries"][key]
+            cache["misses"][fn.__name__] += 1
+            gen = cache["gen"].get(day, 0)
+        val = fn(day, *args)
+        with cache["lock"]:
+            # ako je dan invalidiran dok smo čitali, rezultat može biti zastario – ne spremamo ga
+            if cache["gen"].get(day, 0) == gen:
+                cache["entries"][key] = val; cache["by_day"].setdefault(day, set()).add(key)
+                while len(cache["entries"]) > CACHE_MAX_ENTRIES:
+                    old, _ = cache["entries"].popitem(last=False)
+                    cache["by_day"].get(old[1], set()).discard(old)
+        return val
+    return wrapper
+
+def invalidate_days(days):
+    days = set(days)
+    cache = _query_cache()
+    with cache["lock"]:
+        for day in days:
+            cache["gen"][day] = cache["gen"].get(day, 0) + 1
+            for key in cache["by_day"].pop(day, ()): cache["entries"].pop(key, None)
+
+def sync_caches(rev: int):
+    # jednom po reruna: ako je rev narastao (i zbog drugog procesa), iz change_log-a invalidiramo samo promijenjene dane
+    cache = _query_cache()
+    last = cache["rev"]
+    if last >= rev: return
+    with reader() as con:
+        days = [r[0] for r in con.execute("SELECT DISTINCT service_date FROM change_log WHERE rev>?", (last,))]
+    invalidate_days(days)
+    cache["rev"] = rev
+
+@day_cached
 def count_summary(day: str):
-    with db() as con:
-        total = con.execute("SELECT COUNT(*) FROM departures WHERE service_date=?", (day,)).fetchone()[0]
-        trains = con.execute("SELECT COUNT(*) FROM departures WHERE service_date=? AND transport_type='Train'", (day,)).fetchone()[0]
-        cars   = con.execute("SELECT COUNT(*) FROM departures WHERE service_date=? AND transport_type='Car'", (day,)).fetchone()[0]
-    return total, trains, cars
-
-@st.cache_data(show_spinner=False, ttl=2)
-def get_rows(day: str, where_sql: str, where_args: tuple, order_sql: str):
-    sql = f"SELECT * FROM departures WHERE service_date=? {where_sql} {order_sql}"
-    with db() as con:
-        cur = con.execute(sql, (day, *where_args))
-        cols = [c[0] for c in cur.description]
-        rows = cur.fetchall()
-    return pd.DataFrame(rows, columns=cols)
-
-@st.cache_data(show_spinner=False, ttl=2)
-def export_day(day: str):
-    with db() as con:
-        cur = con.execute("SELECT * FROM departures WHERE service_date=? ORDER BY departure_time, destination", (day,))
-        cols = [c[0] for c in cur.description]
-        return pd.DataFrame(cur.fetchall(), columns=cols)
-
-def invalidate_caches():
-    count_summary.clear(); get_rows.clear(); export_day.clear()
+    # jedan red iz daily_summary (održavaju ga triggeri), nema COUNT(*) skeniranja
+    with reader() as con:
+        row = con.execute("SELECT total, trains, cars FROM daily_summary WHERE service_date=?", (day,)).fetchone()
+    return tuple(row) if row else (0, 0, 0)
+
+@day_cached
+def is_archived(day: str) -> bool:
+    # live tick ga ne pita bazu; _archive_month invalidira sve dane mjeseca koji seli
+    with reader() as con:
+        return archive_file(con, day) is not None
+
+@day_cached
+def day_breakdown(day: str) -> pd.DataFrame:
+    with reader() as con:
+        rows = con.execute("""SELECT destination, transport_type, n FROM daily_breakdown
+                              WHERE service_date=?""", (day,)).fetchall()
+    if not rows: return pd.DataFrame()
+    return (pd.DataFrame(rows, columns=["destination", "transport_type", "n"])
+              .pivot_table(index="destination", columns="transport_type", values="n", aggfunc="sum", fill_value=0))
+
+# keyset paginacija nad snapshotom: seek po (sort ključ..., id) umjesto OFFSET-a
+PAGE_SIZES = [25, 50, 100, 200]
+
+def _filtered(day: str, dest: str, q: str, sort: str) -> pd.DataFrame:
+    v = day_snapshot(day)["views"][sort]
+    if dest: v = v[v["destination"] == dest]
+    if q: v = v[v["unit_number"].str.upper().str.contains(q, regex=False)]
+    return v
+
+@day_cached
+def get_page(day: str, dest: str, q: str, sort: str, after: tuple | None, limit: int):
+    v = _filtered(day, dest, q, sort)
+    start = 0
+    if after is not None:
+        start = bisect_right(list(zip(*(v[k].tolist() for k in SORTS[sort]))), tuple(after))
+    return v.iloc[start:start+limit].reset_index(drop=True), start + limit < len(v)
+
+@day_cached
+def count_rows(day: str, dest: str, q: str) -> int:
+    if not dest and not q: return count_summary(day)[0]
+    return len(_filtered(day, dest, q, "time"))
+
+def export_day(day: str) -> pd.DataFrame:
+    return day_snapshot(day)["views"]["time"]
+
+# =======================
+# Pretraga preko više dana – FTS5 trigram (unit + komentar); prefiks pogoci na unitu idu prvi
+# =======================
+SEARCH_LIMIT = 200
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def search_departures(q: str, since: str, rev: int) -> pd.DataFrame:
+    q = q.strip()
+    cols = ", ".join(f"d.{c}" for c in COLS)
+    if len(q) >= 3:
+        # trigram indeks treba barem 3 znaka; fraza u navodnicima = doslovni substring
+        sql = f"""SELECT {cols}, d.unit_norm LIKE ? AS pfx FROM {{db}}.departures_fts f JOIN {{db}}.departures d ON d.id = f.rowid
+                  WHERE departures_fts MATCH ? AND d.service_date >= ?
+                  ORDER BY pfx DESC, d.service_date DESC, d.departure_time LIMIT ?"""
+        args = (q.upper() + "%", '"' + q.replace('"', '""') + '"', since, SEARCH_LIMIT)
+    else:
+        sql = f"""SELECT {cols}, d.unit_norm LIKE ? AS pfx FROM {{db}}.departures d
+                  WHERE d.service_date >= ? AND (d.unit_norm LIKE ? OR d.comment LIKE ?)
+                  ORDER BY pfx DESC, d.service_date DESC, d.departure_time LIMIT ?"""
+        args = (q.upper() + "%", since, f"%{q.upper()}%", f"%{q}%", SEARCH_LIMIT)
+    with reader() as con:
+        rows = con.execute(sql.format(db="main"), args).fetchall()
+        # arhivirani mjeseci od `since` naovamo – svaka arhiva ima svoj trigram indeks
+        files = [r[0] for r in con.execute("SELECT file FROM archive_months WHERE month >= ?", (since[:7],))]
+        for file in files:
+            with attached(con, file):
+                rows += con.execute(sql.format(db="arch"), args).fetchall()
+    df = pd.DataFrame(rows, columns=(*COLS, "pfx"))
+    if files:  # mjesec usred arhiviranja može biti u oba tiera – hot red (prvi) ostaje
+        df = df.drop_duplicates("id").sort_values(["pfx", "service_date", "departure_time"],
+                                                  ascending=[False, False, True], kind="stable")
+    return df.head(SEARCH_LIMIT).drop(columns="pfx").reset_index(drop=True)
+
+# =======================
+# Analitika – grafovi se crtaju iz rollup tablica (rollup_hour, rollup_gate, daily_breakdown), ne iz departures.
+# Za raspon od nekoliko mjeseci to je par tisuća agregiranih redova koje SQL svede na par stotina.
+# =======================
+@st.cache_resource(show_spinner=False)
+def rollup_backfill():
+    # jednom po procesu: mjeseci koji su bili arhivirani prije migracije 7 pune rollupe iz svoje arhive
+    with writer() as con:
+        for (month,) in con.execute("SELECT month FROM rollup_backfill").fetchall():
+            with attached(con, archive_file(con, f"{month}-01")):
+                con.execute("BEGIN IMMEDIATE")
+                con.execute("""INSERT INTO rollup_hour SELECT service_date, CAST(substr(departure_time, 1, 2) AS INTEGER), COUNT(*)
+                               FROM arch.departures GROUP BY 1, 2""")
+                con.execute("INSERT INTO rollup_gate SELECT service_date, gate, COUNT(*) FROM arch.departures GROUP BY 1, 2")
+                con.execute("DELETE FROM rollup_backfill WHERE month=?", (month,))
+                con.execute("COMMIT")
+    return True
+rollup_backfill()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def analytics(start: str, end: str, rev: int) -> dict:
+    # rev = revizija raspona; promjena bilo kojeg dana u rasponu daje novi ključ
+    span = (start, end)
+    with reader() as con:
+        hours = pd.DataFrame(con.execute("""SELECT hour, SUM(n) FROM rollup_hour WHERE service_date BETWEEN ? AND ?
+                                            GROUP BY hour ORDER BY hour""", span).fetchall(), columns=["hour", "n"])
+        dests = pd.DataFrame(con.execute("""SELECT destination, transport_type, SUM(n) FROM daily_breakdown
+                                            WHERE service_date BETWEEN ? AND ? GROUP BY 1, 2 ORDER BY 1""", span).fetchall(),
+                             columns=["destination", "transport_type", "n"])
+        gates = pd.DataFrame(con.execute("""SELECT gate, SUM(n) FROM rollup_gate WHERE service_date BETWEEN ? AND ?
+                                            GROUP BY gate ORDER BY gate""", span).fetchall(), columns=["gate", "n"])
+        weeks = pd.DataFrame(con.execute("""SELECT date(service_date, 'weekday 0', '-6 days'), transport_type, SUM(n)
+                                            FROM daily_breakdown WHERE service_date BETWEEN ? AND ?
+                                            GROUP BY 1, 2 ORDER BY 1""", span).fetchall(),
+                             columns=["week", "transport_type", "n"])
+    return {"hours": hours, "dests": dests, "gates": gates, "weeks": weeks}
 
 # =======================
 # CRUD
 # =======================
-def insert_row(day, unit, gate, tstr, transport, dest, comment):
+def _is_dup(e: sqlite3.IntegrityError) -> bool:
+    return "UNIQUE" in str(e)
+
+INSERT_SQL = """INSERT INTO departures(service_date, unit_number, gate, departure_time,
+                                          transport_type, destination, comment, created_at)
+                VALUES(?,?,?,?,?,?,?,?)"""
+
+def validate_departure(unit, gate, tval, dest):
+    # ista pravila za Add formu, inline edit i bulk import
+    if not str(unit or "").strip() or not str(gate or "").strip() or not tval or not str(dest or "").strip():
+        return "validation"
+    if not str(gate).strip().isdigit():
+        return "gate_digits_block"
+    return None
+
+# =======================
+# Write queue – jedan pozadinski writer thread; zahtjevi koji stignu istovremeno idu u jednu
+# transakciju (group commit), svaki u svom SAVEPOINT-u, a rezultat se vraća sesiji preko Future-a
+# =======================
+GROUP_COMMIT_MAX = 64
+GROUP_COMMIT_WAIT = 0.005  # s – koliko writer čeka da se skupi još zahtjeva
+WRITE_TIMEOUT = 30
+
+def _insert_op(con, day, unit, gate, tstr, transport, dest, comment):
+    if archive_file(con, day): return (False, "archived"), []
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with db() as con:
-        dup = con.execute("""SELECT 1 FROM departures
-                             WHERE service_date=? AND UPPER(unit_number)=UPPER(?)
-                               AND departure_time=? AND destination=?""",
-                          (day, unit.strip(), tstr, dest.strip())).fetchone()
-        if dup: return False, "dup"
-        con.execute("""INSERT INTO departures(service_date, unit_number, gate, departure_time,
-                                             transport_type, destination, comment, created_at)
-                       VALUES(?,?,?,?,?,?,?,?)""",
-                    (day, unit.strip().upper(), int(gate), tstr, transport, dest.strip(), comment.strip(), now))
-    invalidate_caches()
-    return True, None
+    con.execute(INSERT_SQL, (day, unit.strip().upper(), int(gate), tstr, transport, dest.strip(), comment.strip(), now))
+    return (True, None), [day]
+
+def _update_op(con, row_id, day, unit, gate, tstr, transport, dest, comment):
+    if archive_file(con, day): return (False, "archived"), []
+    old = con.execute("SELECT service_date FROM departures WHERE id=?", (row_id,)).fetchone()
+    con.execute("""UPDATE departures
+                   SET service_date=?, unit_number=?, gate=?, departure_time=?, transport_type=?, destination=?, comment=?
+                   WHERE id=?""",
+                (day, unit.strip().upper(), int(gate), tstr, transport, dest.strip(), comment.strip(), row_id))
+    return (True, None), [day] + ([old[0]] if old else [])
+
+def _delete_op(con, row_id):
+    old = con.execute("SELECT service_date FROM departures WHERE id=?", (row_id,)).fetchone()
+    con.execute("DELETE FROM departures WHERE id=?", (row_id,))
+    return (True, None), [old[0]] if old else []
+
+def _apply_batch(batch):
+    results, days = [], set()
+    with writer() as con:
+        con.execute("BEGIN IMMEDIATE")
+        # tek sad (writer i write lock su naši) zahtjev postaje RUNNING; onaj kojem je sesija već odustala preskačemo
+        for op, args, fut in [b for b in batch if b[2].set_running_or_notify_cancel()]:
+            con.execute("SAVEPOINT op")
+            try:
+                res, touched = op(con, *args)
+                con.execute("RELEASE op")
+                results.append((fut, res, None)); days.update(touched)
+            except Exception as e:
+                # duplikat (i prema bazi i unutar iste grupe) ruši samo svoj zahtjev, ne cijelu grupu
+                con.execute("ROLLBACK TO op"); con.execute("RELEASE op")
+                if isinstance(e, sqlite3.IntegrityError) and _is_dup(e): results.append((fut, (False, "dup"), None))
+                else: results.append((fut, None, e))
+    return results, days
+
+def _writer_loop(q):
+    while True:
+        batch = [q.get()]
+        deadline = monotonic() + GROUP_COMMIT_WAIT
+        while len(batch) < GROUP_COMMIT_MAX:
+            try: batch.append(q.get(timeout=max(0.0, deadline - monotonic())))
+            except queue.Empty: break
+        try:
+            results, days = _apply_batch(batch)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done(): fut.set_exception(e)
+            continue
+        try:
+            invalidate_days(days)
+        except Exception:
+            # zapis je već commitan; cache će ionako uhvatiti sync_caches preko change_log-a – thread mora preživjeti
+            log.exception("cache invalidation failed after commit")
+        for fut, res, err in results:
+            try:
+                if err is None: fut.set_result(res)
+                else: fut.set_exception(err)
+            except Exception:
+                log.exception("could not resolve write result")
+
+@st.cache_resource(show_spinner=False)
+def _write_queue():
+    q = queue.Queue()
+    threading.Thread(target=_writer_loop, args=(q,), name="departures-writer", daemon=True).start()
+    return q
+
+def _submit(op, *args):
+    # -> (ok, err). Ako writer ne stigne do zahtjeva na vrijeme (VACUUM, arhiviranje, veliki import drže writer),
+    # zahtjev se povlači iz reda – ništa se ne upiše kasnije iza leđa korisniku. Već pokrenut se samo dočeka.
+    fut = Future()
+    _write_queue().put((op, args, fut))
+    try:
+        return fut.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeout:
+        if fut.cancel(): return False, "busy"
+        return fut.result()
+
+def insert_row(day, unit, gate, tstr, transport, dest, comment):
+    return _submit(_insert_op, day, unit, gate, tstr, transport, dest, comment)
 
 def update_row(row_id, day, unit, gate, tstr, transport, dest, comment):
-    with db() as con:
-        dup = con.execute("""SELECT 1 FROM departures
-                             WHERE id<>? AND service_date=? AND UPPER(unit_number)=UPPER(?)
-                               AND departure_time=? AND destination=?""",
-                          (row_id, day, unit.strip(), tstr, dest.strip())).fetchone()
-        if dup: return False, "dup"
-        con.execute("""UPDATE departures
-                       SET service_date=?, unit_number=?, gate=?, departure_time=?, transport_type=?, destination=?, comment=?
-                       WHERE id=?""",
-                    (day, unit.strip().upper(), int(gate), tstr, transport, dest.strip(), comment.strip(), row_id))
-    invalidate_caches()
-    return True, None
+    return _submit(_update_op, row_id, day, unit, gate, tstr, transport, dest, comment)
 
 def delete_row(row_id):
-    with db() as con:
-        con.execute("DELETE FROM departures WHERE id=?", (row_id,))
-    invalidate_caches()
+    return _submit(_delete_op, row_id)
+
+def bulk_insert(rows):
+    # rows: (row_no, day, unit, gate, tstr, transport, dest, comment) – već validirani.
+    # Duplikati (prema bazi i unutar same datoteke) se hvataju set lookupom, sve ide u jednu transakciju.
+    # BEGIN IMMEDIATE prije čitanja postojećih slotova – drugi proces ne može upisati isti slot između.
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    batch, nos, rejects = [], [], []
+    with writer() as con:
+        con.execute("BEGIN IMMEDIATE")
+        days, seen = sorted({r[1] for r in rows}), set()
+        archived = {r[0] for r in con.execute("SELECT month FROM archive_months")}
+        for i in range(0, len(days), 500):
+            part = days[i:i+500]
+            seen.update(con.execute(
+                f"""SELECT service_date, unit_norm, departure_time, destination FROM departures
+                    WHERE service_date IN ({','.join('?'*len(part))})""", part))
+        for no, day, unit, gate, tstr, transport, dest, comment in rows:
+            if day[:7] in archived:
+                rejects.append((no, "archived")); continue
+            key = (day, unit.strip().upper(), tstr, dest.strip())
+            if key in seen:
+                rejects.append((no, "duplicate")); continue
+            seen.add(key); nos.append(no)
+            batch.append((day, unit.strip().upper(), int(gate), tstr, transport, dest.strip(), comment.strip(), now))
+        con.execute("SAVEPOINT bulk")
+        try:
+            con.executemany(INSERT_SQL, batch)
+            con.execute("RELEASE bulk")
+        except sqlite3.IntegrityError:
+            # ne bi se smjelo dogoditi (slotovi su pročitani u istoj transakciji), ali ako ipak: red po red
+            con.execute("ROLLBACK TO bulk"); con.execute("RELEASE bulk")
+            rows_ok = []
+            for no, b in zip(nos, batch):
+                try:
+                    con.execute(INSERT_SQL, b); rows_ok.append(b)
+                except sqlite3.IntegrityError as e:
+                    if not _is_dup(e): raise
+                    rejects.append((no, "duplicate"))
+            batch = rows_ok
+    invalidate_days(b[0] for b in batch)
+    return len(batch), rejects
+
+# =======================
+# Import rasporeda (CSV/XLSX)
+# =======================
+IMPORT_ALIASES = {
+    "service_date": ("service_date", "service date", "date", "dato"),
+    "unit_number": ("unit_number", "unit", "enhet"),
+    "gate": ("gate", "luke"),
+    "departure_time": ("departure_time", "time", "tid"),
+    "transport_type": ("transport_type", "transport"),
+    "destination": ("destination", "destinasjon"),
+    "comment": ("comment", "kommentar"),
+}
+TRANSPORTS = {"train": "Train", "tog": "Train", "car": "Car", "bil": "Car"}
+
+def _parse_dt(v, fmts, out):
+    for fmt in fmts:
+        try: return datetime.strptime(v, fmt).strftime(out)
+        except ValueError: pass
+    return None
+
+def read_import(name: str, data: bytes) -> pd.DataFrame:
+    if name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(BytesIO(data), dtype=str, keep_default_na=False)
+    # utf-8-sig: Excelov "CSV UTF-8" počinje BOM-om, koji bi se inače zalijepio za prvo zaglavlje
+    return pd.read_csv(BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig", sep=None, engine="python")
+
+def parse_import(df: pd.DataFrame, default_day: str):
+    names = {str(c).strip().lower(): c for c in df.columns}
+    cols = {k: next((names[a] for a in aliases if a in names), None) for k, aliases in IMPORT_ALIASES.items()}
+    rows, rejects = [], []
+    for no, r in enumerate(df.to_dict("records"), start=2):  # red 1 je zaglavlje
+        get = lambda k: str(r[cols[k]]).strip() if cols[k] is not None else ""
+        unit, gate, dest, comment = get("unit_number"), get("gate"), get("destination"), get("comment")
+        gate = gate[:-2] if gate.endswith(".0") else gate  # Excel broj → "3.0"
+        tstr = _parse_dt(get("departure_time"), ("%H:%M", "%H:%M:%S", "%H.%M"), "%H:%M")
+        day = get("service_date")
+        day = _parse_dt(day[:10] if "-" in day else day, ("%Y-%m-%d", "%d.%m.%Y"), "%Y-%m-%d") if day else default_day
+        transport = TRANSPORTS.get(get("transport_type").lower())
+        if get("departure_time") and tstr is None: err = "bad_time"
+        elif day is None: err = "bad_date"
+        else: err = validate_departure(unit, gate, tstr, dest)
+        if err is None and dest not in DESTINATIONS: err = "bad_dest"
+        if err is None and transport is None: err = "bad_transport"
+        if err: rejects.append((no, err))
+        else: rows.append((no, day, unit, gate, tstr, transport, dest, comment))
+    return rows, rejects
 
 # =======================
 # State
@@ -232,6 +1142,7 @@ if "edit_id" not in st.session_state: st.session_state.edit_id = None
 # =======================
 # Sidebar: date & summary
 # =======================
+phase("sidebar")
 c1, c2 = st.sidebar.columns(2)
 if c1.button(TXT["prev_day"]): st.session_state.service_date -= timedelta(days=1)
 if c2.button(TXT["today"]): st.session_state.service_date = date.today()
@@ -240,15 +1151,34 @@ if picked != st.session_state.service_date:
     st.session_state.service_date = picked
 
 day_str = st.session_state.service_date.strftime("%Y-%m-%d")
-total, trains, cars = count_summary(day_str)
-st.sidebar.subheader(TXT["count_title"])
-m1, m2, m3 = st.sidebar.columns(3)
-m1.metric(TXT["total"], total); m2.metric(TXT["train_count"], trains); m3.metric(TXT["car_count"], cars)
+
+def summary_tick(day: str) -> tuple:
+    # podatkovni dio jednog ticka live_summary – jedini "je li se išta promijenilo?" upit; bench.py zove isto
+    rev = data_revision()
+    sync_caches(rev)
+    return rev, count_summary(day)
+
+@st.fragment(run_every=LIVE_REFRESH)
+@traced("summary")
+def live_summary(day):
+    rev, (total, trains, cars) = summary_tick(day)
+    st.session_state.live_rev = rev
+    st.subheader(TXT["count_title"])
+    m1, m2, m3 = st.columns(3)
+    m1.metric(TXT["total"], total); m2.metric(TXT["train_count"], trains); m3.metric(TXT["car_count"], cars)
+    if total:
+        with st.expander(TXT["breakdown"]):
+            bd = day_breakdown(day)
+            st.dataframe(bd.rename(columns={"Train": TXT["train_count"], "Car": TXT["car_count"]}))
+
+with st.sidebar:
+    live_summary(day_str)
 st.sidebar.caption(TXT["auto_refresh_note"])
 
 # =======================
 # Title
 # =======================
+phase("add_form")
 st.title(TXT["title"])
 
 # =======================
@@ -281,13 +1211,10 @@ with st.form("add_form", clear_on_submit=False):
     submit_add = st.form_submit_button(TXT["register"])
 
 if submit_add:
-    if (not st.session_state.add_unit or
-        not st.session_state.add_gate or
-        not st.session_state.add_time or
-        st.session_state.add_dest is None):
-        st.warning(TXT["validation"])
-    elif not st.session_state.add_gate.isdigit():
-        st.warning(TXT["gate_digits_block"])
+    err = validate_departure(st.session_state.add_unit, st.session_state.add_gate,
+                             st.session_state.add_time, st.session_state.add_dest)
+    if err:
+        st.warning(TXT[err])
     else:
         ok, err = insert_row(
             day_str,
@@ -298,43 +1225,78 @@ if submit_add:
             st.session_state.add_dest,
             st.session_state.add_comment or ""
         )
-        if not ok and err == "dup":
-            st.warning(TXT["duplicate"])
+        if not ok:
+            st.warning(TXT["duplicate"] if err == "dup" else TXT[err])
         else:
             st.success(TXT["saved"])
             st.session_state["add_clear_pending"] = True
             st.rerun()
 
+# =======================
+# Bulk import
+# =======================
+phase("import")
+with st.expander(TXT["import"]):
+    st.caption(TXT["import_help"])
+    up = st.file_uploader(TXT["import_file"], type=["csv", "xlsx"], key="imp_file")
+    if up is not None and st.button(TXT["import_run"], key="imp_run"):
+        try:
+            parsed, rejects = parse_import(read_import(up.name, up.getvalue()), day_str)
+        except Exception:
+            parsed, rejects = [], [(1, "bad_file")]
+        n_ok, dups = bulk_insert(parsed) if parsed else (0, [])
+        rejects = sorted(rejects + dups)
+        st.success(TXT["import_done"].format(n=n_ok))
+        if rejects:
+            st.warning(TXT["import_rejects"].format(n=len(rejects)))
+            st.dataframe(pd.DataFrame([(no, TXT[err]) for no, err in rejects], columns=[TXT["import_row"], TXT["import_reason"]]),
+                         hide_index=True)
+
 st.markdown("<hr>", unsafe_allow_html=True)
 
 # =======================
 # Filter (popover)
 # =======================
+phase("filters")
 fc, _ = st.columns([1, 8])
 with fc.popover(TXT["filter"]):
     dest_filter = st.selectbox(TXT["destination"], ["All"] + [d for d in DESTINATIONS if d], index=0, key="flt_dest")
     sort_choice = st.selectbox(TXT["sort"], [TXT["sort_time"], TXT["sort_dest"]], key="flt_sort")
     quick = st.text_input(TXT["search_unit"], key="flt_q")
+    scope = st.selectbox(TXT["search_scope"], ["day", "month", "all"], format_func=lambda k: TXT["scope_" + k], key="flt_scope")
+    page_size = st.selectbox(TXT["page_size"], PAGE_SIZES, index=1, key="flt_page_size")
     if st.button(TXT["clear"]):
         st.session_state.flt_dest="All"; st.session_state.flt_sort=TXT["sort_time"]; st.session_state.flt_q=""
 
-# SQL filter/order
-where_sql, where_args = "", ()
-if st.session_state.get("flt_dest","All") != "All":
-    where_sql += " AND destination=?"; where_args += (st.session_state.flt_dest,)
-if st.session_state.get("flt_q","").strip():
-    where_sql += " AND UPPER(unit_number) LIKE ?"; where_args += (f"%{st.session_state.flt_q.strip().upper()}%",)
-order_sql = " ORDER BY destination, departure_time" if st.session_state.get("flt_sort",TXT["sort_time"])==TXT["sort_dest"] else " ORDER BY departure_time, destination"
+# filter/sort – primjenjuje se u memoriji nad snapshotom dana
+dest_f = st.session_state.get("flt_dest","All"); dest_f = "" if dest_f == "All" else dest_f
+q_f = st.session_state.get("flt_q","").strip().upper()
+sort_key = "dest" if st.session_state.get("flt_sort",TXT["sort_time"])==TXT["sort_dest"] else "time"
+page_size = st.session_state.get("flt_page_size", PAGE_SIZES[1])
+scope_f = st.session_state.get("flt_scope", "day")
 
-# =======================
-# Dohvati sve (bez paginacije)
-# =======================
-df = get_rows(day_str, where_sql, where_args, order_sql)
+def clear_row_actions(keep=()) -> bool:
+    # otvoreni Edit / potvrda brisanja za redove koji nisu na ekranu – inače live lista ostaje pauzirana zauvijek
+    cleared = False
+    if st.session_state.edit_id is not None and st.session_state.edit_id not in keep:
+        st.session_state.edit_id = None; cleared = True
+    for k in [k for k, v in st.session_state.items() if str(k).startswith("askdel_") and v]:
+        if int(str(k)[7:]) not in keep:
+            del st.session_state[k]; cleared = True
+    return cleared
+
+def _next_page(cursor):
+    clear_row_actions()
+    st.session_state.page_cursors.append(cursor)
+
+def _prev_page():
+    clear_row_actions()
+    if len(st.session_state.page_cursors) > 1: st.session_state.page_cursors.pop()
 
 # =======================
 # Tile renderer – kompaktan red + 3 točke (Edit/Delete)
 # =======================
-def render_tile(row):
+def render_tile(row, locked=False):
     rid = int(row["id"])
     editing = (st.session_state.edit_id == rid)
 
@@ -354,23 +1316,26 @@ def render_tile(row):
         )
         st.markdown(f"<div class='muted' style='margin-top:6px'>{row['comment'] or '—'}</div>", unsafe_allow_html=True)
 
-        # 3 točke – popover s obojenim gumbima (Edit zelen, Delete crven)
+        # 3 točke – popover s obojenim gumbima (Edit zelen, Delete crven); arhivirani dani su samo za čitanje
         c1, _, _ = st.columns([0.2, 0.2, 6])
-        with c1:
-            with st.popover(TXT["menu_more"]):
-                a1, a2 = st.columns(2)
-                if a1.button(TXT["edit"], key=f"ed_{rid}"):
-                    st.session_state.edit_id = rid
-                if a2.button(TXT["delete"], key=f"dl_{rid}"):
-                    st.session_state[f"askdel_{rid}"] = True
+        if not locked:
+            with c1:
+                with st.popover(TXT["menu_more"]):
+                    a1, a2 = st.columns(2)
+                    if a1.button(TXT["edit"], key=f"ed_{rid}"):
+                        st.session_state.edit_id = rid; st.rerun()
+                    if a2.button(TXT["delete"], key=f"dl_{rid}"):
+                        st.session_state[f"askdel_{rid}"] = True; st.rerun()
 
         if st.session_state.get(f"askdel_{rid}"):
             st.warning(TXT["confirm_del"])
             d1, d2 = st.columns(2)
             if d1.button(TXT["yes"], key=f"yes_{rid}"):
-                delete_row(rid); st.session_state[f"askdel_{rid}"] = False; st.success(TXT["deleted"])
+                ok, err = delete_row(rid)
+                if not ok: st.warning(TXT[err])
+                else: st.session_state[f"askdel_{rid}"] = False; st.session_state.flash = TXT["deleted"]; st.rerun()
             if d2.button(TXT["no"], key=f"no_{rid}"):
-                st.session_state[f"askdel_{rid}"] = False
+                st.session_state[f"askdel_{rid}"] = False; st.rerun()
 
     else:
         # INLINE EDIT unutar istog tile-a (jedan submit → Save Edit)
@@ -395,13 +1360,16 @@ def render_tile(row):
                              index=0 if row["transport_type"]=="Train" else 1, key=f"tr_{rid}")
             com = st.text_area(TXT["comment"], value=str(row["comment"]) if str(row["comment"]) not in ("nan","None") else "", height=58, key=f"c_{rid}")
 
-            sbtn = st.form_submit_button(TXT["save_changes"])
+            s1, s2, _ = st.columns([1, 1, 4])
+            sbtn = s1.form_submit_button(TXT["save_changes"])
+            cbtn = s2.form_submit_button(TXT["no"])
 
+        if cbtn:
+            st.session_state.edit_id = None; st.rerun()
         if sbtn:
-            if not uval or not gval.strip() or not tval or not dsel:
-                st.warning(TXT["validation"])
-            elif not gval.isdigit():
-                st.warning(TXT["gate_digits_block"])
+            err = validate_departure(uval, gval, tval, dsel)
+            if err:
+                st.warning(TXT[err])
             else:
                 ok, err = update_row(
                     rid,
@@ -409,32 +1377,82 @@ def render_tile(row):
                     uval, gval, tval.strftime("%H:%M"),
                     trval, str(dsel), com
                 )
-                if not ok and err=="dup":
-                    st.warning(TXT["duplicate"])
+                if not ok:
+                    st.warning(TXT["duplicate"] if err == "dup" else TXT[err])
                 else:
                     st.session_state.edit_id = None
-                    st.success(TXT["updated"])
+                    st.session_state.flash = TXT["updated"]; st.rerun()
 
     st.markdown("</div>", unsafe_allow_html=True)
 
 # =======================
-# Lista
+# Lista – live fragment: svaki tick ponovno crta samo listu (keyset stranica), ne cijelu skriptu
 # =======================
-st.subheader(TXT["list"])
-if df.empty:
-    st.info(TXT["none"])
-else:
-    for _, r in df.iterrows():
-        render_tile(r)
+def list_tick(day, dest, q, sort, size, after, rev) -> tuple:
+    # podatkovni dio ticka live_list: stranica, ima li dalje, ukupno (samo uz paginaciju), zaključan dan
+    sync_caches(rev)
+    df, has_next = get_page(day, dest, q, sort, after, size)
+    n_rows = count_rows(day, dest, q) if after is not None or has_next else None
+    return df, has_next, n_rows, is_archived(day)
+
+def live_paused() -> bool:
+    # dok netko uređuje red ili potvrđuje brisanje, tick ne smije pregaziti unos
+    return st.session_state.edit_id is not None or any(
+        v for k, v in st.session_state.items() if str(k).startswith("askdel_"))
+
+@traced("list")
+def live_list(day, dest, q, sort, size, scope):
+    # rev koji je live_summary pročitao (full rerun: ovaj; tick: najviše jedan tick star) – jedan "je li se išta
+    # promijenilo?" upit po ticku. Redovi liste ionako idu kroz day_snapshot, koji sam provjeri reviziju dana.
+    rev = st.session_state.get("live_rev")
+    if rev is None: rev = data_revision()
+    if msg := st.session_state.pop("flash", None): st.toast(msg)
+    paused = live_paused()
+    if q and scope != "day":
+        if clear_row_actions() and paused: st.rerun()
+        since = "" if scope == "all" else (date.today() - timedelta(days=31)).strftime("%Y-%m-%d")
+        res = search_departures(q, since, rev)
+        st.subheader(TXT["search_results"].format(n=len(res)))
+        if res.empty: st.info(TXT["none"])
+        else: st.dataframe(res.drop(columns=["id", "created_at"]), hide_index=True)
+        return
+    page_sig = (day, dest, q, sort, size)
+    if st.session_state.get("page_sig") != page_sig:
+        st.session_state.page_sig = page_sig; st.session_state.page_cursors = [None]
+        stale = clear_row_actions()
+    else:
+        stale = False
+    df, has_next, n_rows, locked = list_tick(day, dest, q, sort, size, st.session_state.page_cursors[-1], rev)
+    # red koji se uređivao je obrisan/premješten (i drugi dispečer) ili je promijenjen dan/stranica –
+    # pauza se skida, a full rerun ponovno uključi tick fragmenta
+    stale = clear_row_actions(set(df["id"].tolist())) or stale
+    if stale and paused: st.rerun()
+
+    phase("list.render")
+    st.subheader(TXT["list"])
+    if locked: st.caption(TXT["archived"])
+    if df.empty:
+        st.info(TXT["none"])
+    else:
+        for r in df.to_dict("records"):
+            render_tile(r, locked)
+
+    page_no = len(st.session_state.page_cursors)
+    if n_rows is not None:
+        start = (page_no - 1) * size + 1
+        p1, p2, p3 = st.columns([1, 3, 1])
+        p1.button(TXT["prev_page"], on_click=_prev_page, disabled=page_no == 1, key="pg_prev")
+        p2.caption(TXT["page_info"].format(page=page_no, start=start, end=start + len(df) - 1, total=n_rows))
+        p3.button(TXT["next_page"], on_click=_next_page, disabled=not has_next, key="pg_next",
+                  args=(tuple(df[list(SORTS[sort])].iloc[-1].tolist()) if not df.empty else None,))
+
+st.fragment(run_every=None if live_paused() else LIVE_REFRESH)(live_list)(day_str, dest_f, q_f, sort_key, page_size, scope_f)
 
 # =======================
 # Export
 # =======================
+phase("export")
 st.markdown("<hr>", unsafe_allow_html=True)
-exp = export_day(day_str); empty = exp.empty
-c1, c2, c3 = st.columns([1,1,1])
-c1.download_button(TXT["export_csv"], exp.to_csv(index=False).encode("utf-8") if not empty else b"",
-                   file_name=f"departures_{day_str}.csv", disabled=empty, help=TXT["empty_export"] if empty else None)
 
 def export_excel(df:pd.DataFrame)->bytes:
     out = BytesIO()
@@ -443,7 +1461,7 @@ def export_excel(df:pd.DataFrame)->bytes:
         w.sheets["Departures"].set_column(0, len(df.columns)-1, 20)
     return out.getvalue()
 
-def export_pdf(df:pd.DataFrame)->bytes|None:
+def export_pdf(df:pd.DataFrame, day:str)->bytes|None:
     try:
         from reportlab.lib.pagesizes import A4
         from reportlab.pdfgen import canvas
@@ -451,10 +1469,10 @@ def export_pdf(df:pd.DataFrame)->bytes|None:
         buf=BytesIO(); c=canvas.Canvas(buf, pagesize=A4)
         W,H=A4; xM,yM=2*cm,2*cm; y=H-yM
         c.setFont("Helvetica-Bold",14)
-        c.drawString(xM,y,"Departures - "+(df["service_date"].iloc[0] if not df.empty else day_str)); y-=1.0*cm
+        c.drawString(xM,y,"Departures - "+(df["service_date"].iloc[0] if not df.empty else day)); y-=1.0*cm
         c.setFont("Helvetica-Bold",10); hdr=" | ".join(df.columns); c.drawString(xM,y,hdr[:200]); y-=0.5*cm
         c.setFont("Helvetica",9); lh=0.55*cm
-        for _, rr in df.iterrows():
+        for rr in df.to_dict("records"):
             line=" | ".join(str(rr.get(h,"")) for h in df.columns)
             if y<yM+lh: c.showPage(); y=H-yM; c.setFont("Helvetica",9)
             c.drawString(xM,y,line[:240]); y-=lh
@@ -462,9 +1480,232 @@ def export_pdf(df:pd.DataFrame)->bytes|None:
     except:
         return None
 
-xlsx = export_excel(exp) if not empty else None
-c2.download_button(TXT["export_xlsx"], xlsx if xlsx else b"", file_name=f"departures_{day_str}.xlsx",
-                   disabled=empty, help=TXT["empty_export"] if empty else None)
-pdf = export_pdf(exp) if not empty else None
-c3.download_button(TXT["export_pdf"], pdf if pdf else b"", file_name=f"departures_{day_str}.pdf",
-                   disabled=empty, help=TXT["empty_export"] if empty else None)
\ No newline at end of file
+# Generira se tek na klik (callable u download_button, vlastiti thread), a rezultat se pamti po
+# reviziji dana – isti podaci se nikad ne kodiraju dvaput; reportlab/xlsxwriter se ne uvoze na običnom ticku.
+@st.cache_data(show_spinner=False, max_entries=32)
+def export_bytes(day: str, day_rev: int, fmt: str) -> bytes:
+    df = export_day(day)
+    if fmt == "csv": return df.to_csv(index=False).encode("utf-8")
+    if fmt == "xlsx": return export_excel(df)
+    return export_pdf(df, day) or b""
+
+@traced("export_file")
+def export_day_bytes(day: str, fmt: str) -> bytes:
+    # revizija se čita tek na klik – gumbi su statični i ne prate tickove
+    return export_bytes(day, day_revision(day), fmt)
+
+MIMES = {"csv": "text/csv", "pdf": "application/pdf",
+         "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+@traced("export")
+def export_buttons(day):
+    empty = count_summary(day)[0] == 0
+    c1, c2, c3 = st.columns([1,1,1])
+    for col, fmt, label in ((c1, "csv", TXT["export_csv"]), (c2, "xlsx", TXT["export_xlsx"]), (c3, "pdf", TXT["export_pdf"])):
+        col.download_button(label, partial(export_day_bytes, day, fmt), file_name=f"departures_{day}.{fmt}",
+                            mime=MIMES[fmt], disabled=empty, help=TXT["empty_export"] if empty else None, key=f"exp_{fmt}")
+
+# statično; osvježava se samo dok je dan prazan, da se gumbi omoguće čim stigne prvi red
+st.fragment(run_every=LIVE_REFRESH if count_summary(day_str)[0] == 0 else None)(export_buttons)(day_str)
+
+# =======================
+# Export raspona datuma – redovi se streamaju iz SQLite-a u komadima ravno u datoteku
+# =======================
+EXPORT_CHUNK = 2000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "departures_exports")
+XLSX_MAX_ROWS = 1_048_576
+PDF_COL_CM = (1.2, 2.2, 2.6, 1.2, 1.6, 2.0, 2.8, 7.0, 3.6)  # širine stupaca, redom kao COLS
+
+def _chunks(rows, chunk):
+    while part := list(islice(rows, chunk)):
+        yield part
+
+def _months(start: str, end: str):
+    y, m = int(start[:4]), int(start[5:7])
+    while f"{y}-{m:02d}" <= end[:7]:
+        yield f"{y}-{m:02d}"
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+def iter_range(start: str, end: str, chunk: int = EXPORT_CHUNK):
+    # vlastita konekcija – dugi export ne drži reader iz poola, a u WAL-u ne blokira writera.
+    # Mjesec po mjesec kalendarskim redom; arhivirani mjesec može imati i hot redove (nije prošao provjeru,
+    # ili je arhiviran prije nego su stigli svi redovi), pa se unutar mjeseca oba tiera spajaju po ključu sorta.
+    con = _connect()
+    order = "ORDER BY service_date, departure_time, destination, id"
+    hot = f"SELECT {SELECT_COLS} FROM main.departures WHERE service_date BETWEEN ? AND ? {order}"
+    arch = f"""SELECT {SELECT_COLS} FROM arch.departures WHERE service_date BETWEEN ? AND ?
+               AND id NOT IN (SELECT id FROM main.departures WHERE service_date BETWEEN ? AND ?) {order}"""
+    key = lambda r: (r[1], r[4], r[6], r[0])
+    try:
+        for month in _months(start, end):
+            lo, hi = max(start, f"{month}-01"), min(end, f"{month}-31")
+            with tier_read(con, lo) as file:
+                curs = [con.execute(hot, (lo, hi))]
+                if file: curs.append(con.execute(arch, (lo, hi, lo, hi)))
+                try:
+                    yield from _chunks(heapq.merge(*curs, key=key), chunk)
+                finally:
+                    for cur in curs: cur.close()
+    finally:
+        con.close()
+
+def range_revision(start: str, end: str) -> int:
+    with reader() as con:
+        return con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log WHERE service_date BETWEEN ? AND ?",
+                           (start, end)).fetchone()[0]
+
+def _write_csv(path, start, end):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f); w.writerow(COLS)
+        for rows in iter_range(start, end): w.writerows(rows)
+
+def _write_xlsx(path, start, end):
+    import xlsxwriter
+    wb = xlsxwriter.Workbook(path, {"constant_memory": True})  # red po red na disk
+    try:
+        sheets, r, ws = 0, XLSX_MAX_ROWS, None
+        for rows in iter_range(start, end):
+            for row in rows:
+                if r >= XLSX_MAX_ROWS:
+                    sheets += 1; r = 1
+                    ws = wb.add_worksheet("Departures" if sheets == 1 else f"Departures {sheets}")
+                    ws.set_column(0, len(COLS)-1, 20); ws.write_row(0, 0, COLS)
+                ws.write_row(r, 0, row); r += 1
+        if ws is None: wb.add_worksheet("Departures").write_row(0, 0, COLS)
+    finally:
+        wb.close()
+
+def _write_pdf(path, start, end):
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.lib.units import cm
+    W, H = landscape(A4); xM, yM, lh = 1.5*cm, 1.5*cm, 0.55*cm
+    widths = [w*cm for w in PDF_COL_CM]
+    xs = [xM + sum(widths[:i]) for i in range(len(widths))]
+    c = canvas.Canvas(path, pagesize=(W, H), pageCompression=1)
+
+    def clip(txt, w, font, size):
+        if stringWidth(txt, font, size) <= w - 4: return txt
+        lo, hi = 0, len(txt)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if stringWidth(txt[:mid], font, size) <= w - 4: lo = mid
+            else: hi = mid - 1
+        return txt[:lo]
+
+    def header(page):
+        c.setFont("Helvetica-Bold", 12); c.drawString(xM, H-yM, f"Departures {start} – {end}")
+        c.setFont("Helvetica", 8); c.drawRightString(W-xM, H-yM, str(page))
+        y = H - yM - 1.0*cm
+        c.setFont("Helvetica-Bold", 8)
+        for x, w, h in zip(xs, widths, COLS): c.drawString(x+2, y, clip(h, w, "Helvetica-Bold", 8))
+        c.line(xM, y-3, xM+sum(widths), y-3)
+        c.setFont("Helvetica", 8)
+        return y - lh
+
+    page = 1; y = header(page)
+    for rows in iter_range(start, end):
+        for row in rows:
+            if y < yM:
+                c.showPage(); page += 1; y = header(page)
+            for x, w, v in zip(xs, widths, row):
+                c.drawString(x+2, y, clip("" if v is None else str(v), w, "Helvetica", 8))
+            y -= lh
+    c.save()
+
+RANGE_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "pdf": _write_pdf}
+
+def export_range(start: str, end: str, fmt: str) -> str:
+    # datoteka je ključana revizijom raspona: isti podaci → ista datoteka, bez ponovnog generiranja
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    prefix = f"departures_{start}_{end}_r"
+    path = os.path.join(EXPORT_DIR, f"{prefix}{range_revision(start, end)}.{fmt}")
+    if not os.path.exists(path):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        RANGE_WRITERS[fmt](tmp, start, end); os.replace(tmp, path)
+        for old in os.listdir(EXPORT_DIR):
+            if old.startswith(prefix) and old.endswith(f".{fmt}") and os.path.join(EXPORT_DIR, old) != path:
+                try: os.remove(os.path.join(EXPORT_DIR, old))
+                except OSError: pass
+    return path
+
+@traced("range_export_file")
+def export_range_bytes(start: str, end: str, fmt: str) -> bytes:
+    with open(export_range(start, end, fmt), "rb") as f:
+        return f.read()
+
+phase("range_export")
+with st.expander(TXT["range_export"]):
+    r1, r2, r3 = st.columns([1, 1, 1])
+    today = date.today()
+    r_from = r1.date_input(TXT["range_from"], value=today.replace(day=1), key="rng_from")
+    r_to = r2.date_input(TXT["range_to"], value=today, key="rng_to")
+    r_fmt = r3.radio(TXT["range_format"], ["csv", "xlsx", "pdf"], horizontal=True, key="rng_fmt")
+    r_start, r_end = sorted((r_from.strftime("%Y-%m-%d"), r_to.strftime("%Y-%m-%d")))
+    st.download_button(TXT["range_download"], partial(export_range_bytes, r_start, r_end, r_fmt),
+                       file_name=f"departures_{r_start}_{r_end}.{r_fmt}", mime=MIMES[r_fmt], key="rng_dl")
+
+# =======================
+# Analitika – samo kad je uključena (plotly se tada tek uvozi); podaci iz rollupa, cache po reviziji raspona
+# =======================
+phase("analytics")
+if st.toggle(TXT["analytics"], key="an_on"):
+    import plotly.express as px
+    a1, a2 = st.columns(2)
+    a_from = a1.date_input(TXT["range_from"], value=today - timedelta(weeks=12), key="an_from")
+    a_to = a2.date_input(TXT["range_to"], value=today, key="an_to")
+    a_start, a_end = sorted((a_from.strftime("%Y-%m-%d"), a_to.strftime("%Y-%m-%d")))
+    an = analytics(a_start, a_end, range_revision(a_start, a_end))
+    if an["hours"].empty:
+        st.info(TXT["none"])
+    else:
+        labels = {"n": TXT["an_n"], "hour": TXT["an_hour_axis"], "week": TXT["an_week_axis"],
+                  "gate": TXT["gate"], "destination": TXT["destination"], "transport_type": TXT["transport"]}
+        colors = {"Train": "#ef4444", "Car": "#16a34a"}
+        g1, g2 = st.columns(2)
+        g1.plotly_chart(px.bar(an["hours"], x="hour", y="n", title=TXT["an_hour"], labels=labels)
+                          .update_xaxes(dtick=1))
+        g2.plotly_chart(px.pie(an["dests"].groupby("transport_type", as_index=False)["n"].sum(), names="transport_type",
+                               values="n", title=TXT["an_mix"], hole=0.5, color="transport_type",
+                               color_discrete_map=colors, labels=labels))
+        g3, g4 = st.columns(2)
+        g3.plotly_chart(px.bar(an["dests"], x="destination", y="n", color="transport_type", title=TXT["an_dest"],
+                               color_discrete_map=colors, labels=labels))
+        g4.plotly_chart(px.bar(an["gates"], x="gate", y="n", title=TXT["an_gate"], labels=labels)
+                          .update_xaxes(type="category"))
+        st.plotly_chart(px.line(an["weeks"], x="week", y="n", color="transport_type", markers=True, title=TXT["an_week"],
+                                color_discrete_map=colors, labels=labels))
+
+# =======================
+# Admin panel – zadnji rerunovi po fazama, pogoci cacheva, spori upiti
+# =======================
+end_run()
+ADMIN = os.environ.get("DEPARTURES_ADMIN") == "1" or st.query_params.get("admin") == "1"
+
+def cache_stats() -> pd.DataFrame:
+    qc, ds = _query_cache(), _day_store()
+    rows = [(name, qc["hits"][name], qc["misses"][name]) for name in sorted(qc["hits"].keys() | qc["misses"].keys())]
+    rows.append(("snapshot", ds["hits"], ds["misses"]))
+    df = pd.DataFrame(rows, columns=["cache", "hits", "misses"])
+    df["hit %"] = (100 * df["hits"] / (df["hits"] + df["misses"]).clip(lower=1)).round(1)
+    return df
+
+if ADMIN:
+    with st.sidebar.expander(TXT["diagnostics"]):
+        runs = list(_metrics()["runs"])[::-1]
+        st.caption(TXT["diag_runs"])
+        st.dataframe(pd.DataFrame([{"at": r["at"], "run": r["kind"], "total": r["ms"], "queries": r["queries"],
+                                    "db": r["db_ms"], "rows": r["rows"], **r["spans"]} for r in runs]).round(2),
+                     hide_index=True)
+        last = next((r for r in runs if r["kind"] == "rerun"), None)
+        if last and last["stmts"]:
+            st.caption(TXT["diag_stmts"])
+            st.dataframe(pd.DataFrame(last["stmts"], columns=["ms", "rows", "sql"]).nlargest(10, "ms").round(2), hide_index=True)
+        st.caption(TXT["diag_cache"])
+        st.dataframe(cache_stats(), hide_index=True)
+        months, rows, hot = archive_stats()
+        st.caption(TXT["diag_tiers"].format(months=months, rows=rows, hot=hot))
+        st.caption(TXT["diag_slow"].format(ms=SLOW_QUERY_MS))
+        st.dataframe(pd.DataFrame(list(_metrics()["slow"])[::-1], columns=["at", "run", "ms", "rows", "sql"]).round(2),
+                     hide_index=True)
@@ -0,0 +1,187 @@
+# =======================
+# Benchmark / load test – simulira N kioska na live ticku nad realno velikim data.db
+#
+#   python bench.py --days 365 --per-day 300 --kiosks 40 --writers 2 --duration 30
+#   python bench.py --apptest 4 --duration 20      # + headless rerunovi cijele skripte (AppTest)
+#
+# Baza je zasebna (--db, default bench.db); app.py se uvozi u "bare" modu nad njom.
+# =======================
+import argparse, multiprocessing, os, random, shutil, sys, threading, time
+from collections import defaultdict
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+app = None  # učitava se u load_app(); AppTest procesi ga ne uvoze
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Departures load test")
+    p.add_argument("--db", default="bench.db")
+    p.add_argument("--days", type=int, default=365, help="dana povijesti za seed")
+    p.add_argument("--per-day", type=int, default=300, help="odlazaka po danu")
+    p.add_argument("--reseed", action="store_true", help="obriši bazu i ponovno seedaj")
+    p.add_argument("--archive", type=int, default=None, metavar="DAYS",
+                   help="prije mjerenja arhiviraj mjesece starije od DAYS dana (hot/cold)")
+    p.add_argument("--kiosks", type=int, default=40, help="paralelnih čitača (live tick)")
+    p.add_argument("--writers", type=int, default=2, help="paralelnih dispečera (insert/update/delete)")
+    p.add_argument("--interval", type=float, default=0.0, help="s između tickova po kiosku (0 = maksimalno opterećenje)")
+    p.add_argument("--apptest", type=int, default=0, help="threadova s AppTest rerunovima cijele skripte")
+    p.add_argument("--duration", type=float, default=20.0, help="trajanje mjerenja u sekundama")
+    p.add_argument("--seed", type=int, default=1)
+    return p.parse_args()
+
+def load_app(db: str, reseed: bool):
+    global app
+    os.environ["DEPARTURES_DB"] = os.path.abspath(db)
+    if reseed:
+        for ext in ("", "-wal", "-shm"):
+            if os.path.exists(db + ext): os.remove(db + ext)
+        shutil.rmtree(os.path.splitext(db)[0] + "_archive", ignore_errors=True)
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")  # bare mode inače zatrpa izlaz upozorenjima o ScriptRunContext-u
+    sys.path.insert(0, HERE)
+    import app as _app  # bare mode: UI pozivi su no-op, data sloj je pravi
+    app = _app
+
+TODAY = date.today()
+
+# =======================
+# Seed
+# =======================
+def seed(days: int, per_day: int, rnd: random.Random):
+    with app.reader() as con:
+        if con.execute("SELECT COUNT(*) FROM departures").fetchone()[0]: return False
+    dests = [d for d in app.DESTINATIONS if d]
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    for d in range(days):
+        day = (TODAY - timedelta(days=d)).strftime("%Y-%m-%d")
+        rows = [(day, f"U{i:04d}", rnd.randint(1, 40), f"{rnd.randint(0, 23):02d}:{rnd.randrange(0, 60, 5):02d}",
+                 rnd.choice(["Train", "Car"]), rnd.choice(dests), rnd.choice(["", "", "late", "double check"]), now)
+                for i in range(per_day)]
+        with app.writer() as con:
+            con.executemany(app.INSERT_SQL.replace("INSERT", "INSERT OR IGNORE", 1), rows)
+    return True
+
+# =======================
+# Mjerenje – latencije po operaciji, broj SQL naredbi po operaciji (trace callback na pool konekcijama)
+# =======================
+lat = defaultdict(list)
+queries = defaultdict(int)
+lat_lock = threading.Lock()
+local = threading.local()
+
+def _trace(_sql):
+    local.n = getattr(local, "n", 0) + 1
+
+def trace_pool():
+    pool = app._pool()
+    for con in list(pool["readers"].queue) + [pool["writer"]]:
+        con.set_trace_callback(_trace)
+
+def timed(name, fn, *a):
+    n0 = getattr(local, "n", 0); t0 = time.perf_counter()
+    out = fn(*a)
+    dt = time.perf_counter() - t0
+    with lat_lock:
+        lat[name].append(dt); queries[name] += getattr(local, "n", 0) - n0
+    return out
+
+# AppTest radi u drugom procesu, a zapisi na writer threadu – njihove naredbe ovdje ne brojimo
+UNTRACED = {"apptest_rerun", "insert", "update", "delete"}
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+# =======================
+# Radnici
+# =======================
+def kiosk(stop, rnd, args):
+    day = TODAY.strftime("%Y-%m-%d")
+    dests = [d for d in app.DESTINATIONS if d]
+
+    def tick():
+        # jedan tick oba live fragmenta – isti podatkovni helperi koje zovu live_summary i live_list
+        rev, _ = app.summary_tick(day)
+        dest = rnd.choice(["", "", "", *dests])
+        q = rnd.choice(["", "", "", "U00", "U01"])
+        app.list_tick(day, dest, q, rnd.choice(["time", "dest"]), 50, None, rev)
+
+    while not stop.is_set():
+        timed("tick", tick)
+        if rnd.random() < 0.01: timed("export_day", app.export_day_bytes, day, "csv")
+        if rnd.random() < 0.01:
+            past = (TODAY - timedelta(days=rnd.randint(1, args.days))).strftime("%Y-%m-%d")
+            timed("tick_past_day", lambda: (app.count_summary(past), app.get_page(past, "", "", "time", None, 50)))
+        if rnd.random() < 0.005: timed("search_all", app.search_departures, f"U{rnd.randint(0, 99):02d}", "", app.data_revision())
+        if args.interval: stop.wait(args.interval)
+
+def dispatcher(stop, rnd):
+    day = TODAY.strftime("%Y-%m-%d")
+    dests = [d for d in app.DESTINATIONS if d]
+    while not stop.is_set():
+        r = rnd.random()
+        unit, tstr = f"B{rnd.randint(0, 99999):05d}", f"{rnd.randint(0, 23):02d}:{rnd.randrange(0, 60, 5):02d}"
+        if r < 0.6:
+            timed("insert", app.insert_row, day, unit, str(rnd.randint(1, 40)), tstr, "Car", rnd.choice(dests), "")
+        else:
+            df = app.get_page(day, "", "", "time", None, 200)[0]
+            if df.empty: continue
+            rid = int(df["id"].iloc[rnd.randrange(len(df))])
+            if r < 0.85: timed("update", app.update_row, rid, day, unit, "7", tstr, "Train", rnd.choice(dests), "bench")
+            else: timed("delete", app.delete_row, rid)
+        stop.wait(0.05)
+
+def apptest_worker(db, duration, out):
+    # zaseban proces: bare-mode import app.py u glavnom procesu ostavlja globalno st stanje koje AppTest ne podnosi
+    os.environ["DEPARTURES_DB"] = os.path.abspath(db)
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    from streamlit.testing.v1 import AppTest
+    at, xs = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=60), []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        t0 = time.perf_counter(); at.run(); xs.append(time.perf_counter() - t0)
+    out.put(xs)
+
+# =======================
+# Main
+# =======================
+def main():
+    args = parse_args()
+    load_app(args.db, args.reseed)
+    trace_pool()
+    rnd = random.Random(args.seed)
+    t0 = time.perf_counter()
+    if seed(args.days, args.per_day, rnd):
+        print(f"seeded {args.days} days x {args.per_day} in {time.perf_counter() - t0:.1f}s")
+    if args.archive is not None:
+        t0 = time.perf_counter(); months = app.archive_old(args.archive)
+        print(f"archived {len(months)} months in {time.perf_counter() - t0:.1f}s")
+    with app.reader() as con:
+        n = con.execute("SELECT COUNT(*) FROM departures").fetchone()[0]
+    print(f"db={args.db} rows={n} kiosks={args.kiosks} writers={args.writers} apptest={args.apptest} duration={args.duration}s")
+
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=apptest_worker, args=(args.db, args.duration, out)) for _ in range(args.apptest)]
+    stop = threading.Event()
+    threads = [threading.Thread(target=kiosk, args=(stop, random.Random(args.seed + i), args)) for i in range(args.kiosks)]
+    threads += [threading.Thread(target=dispatcher, args=(stop, random.Random(-args.seed - i))) for i in range(args.writers)]
+    for p in procs: p.start()
+    for t in threads: t.start()
+    started = time.perf_counter()
+    stop.wait(args.duration); stop.set()
+    for t in threads: t.join()
+    for _ in procs: lat["apptest_rerun"].extend(out.get())
+    for p in procs: p.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{'op':<16}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/op':>8}")
+    for name in sorted(lat):
+        xs = lat[name]
+        q = "-" if name in UNTRACED else f"{queries[name] / len(xs):.2f}"
+        print(f"{name:<16}{len(xs):>8}{len(xs) / elapsed:>10.1f}{pct(xs, 50) * 1e3:>10.2f}"
+              f"{pct(xs, 95) * 1e3:>10.2f}{pct(xs, 99) * 1e3:>10.2f}{q:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# =======================
+# JSON feed za display ploče – read-only HTTP endpoint nad istom data.db, bez Streamlita
+#
+#   python feed.py --port 8502
+#   GET /departures?date=2025-01-31            -> 200 JSON + ETag
+#   GET /departures  (If-None-Match: "<etag>")  -> 304 ako se dan nije promijenio
+#   GET /departures?wait=30 (If-None-Match)     -> long-poll: odgovara čim se dan promijeni, inače 304 nakon 30 s
+#
+# ETag = revizija dana iz change_log-a (isti izvor kao cache u app.py). Jedan watcher thread prati
+# MAX(rev) i budi čekajuće zahtjeve; svaki zahtjev onda provjeri samo reviziju svog dana.
+# =======================
+import argparse, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DB_PATH = os.environ.get("DEPARTURES_DB", "data.db")
+ARCHIVE_DIR = os.environ.get("DEPARTURES_ARCHIVE_DIR", os.path.splitext(DB_PATH)[0] + "_archive")
+COLS = ("id", "service_date", "unit_number", "gate", "departure_time", "transport_type", "destination", "comment")
+SELECT_COLS = ", ".join(COLS)
+MAX_WAIT = 60      # s – gornja granica za long-poll
+BODY_CACHE = 32    # zadnjih (dan, rev) JSON tijela – sve ploče istog dana dijele jedno kodiranje
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Departures JSON feed")
+    p.add_argument("--db", default=DB_PATH)
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=8502)
+    p.add_argument("--poll", type=float, default=0.25, help="s između provjera revizije (watcher)")
+    return p.parse_args()
+
+# =======================
+# DB – read-only konekcija po threadu; u WAL-u čitanje ne blokira app.py
+# =======================
+local = threading.local()
+
+def connect(db):
+    con = sqlite3.connect(f"file:{os.path.abspath(db)}?mode=ro", uri=True, timeout=5, check_same_thread=False)
+    con.execute("PRAGMA busy_timeout=5000")
+    return con
+
+def conn():
+    if getattr(local, "con", None) is None: local.con = connect(DB_PATH)
+    return local.con
+
+def data_revision(con) -> int:
+    return con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log").fetchone()[0]
+
+def day_revision(con, day: str) -> int:
+    return con.execute("SELECT COALESCE(MAX(rev), 0) FROM change_log WHERE service_date=?", (day,)).fetchone()[0]
+
+def archive_file(con, day: str) -> str | None:
+    row = con.execute("SELECT file FROM archive_months WHERE month=?", (day[:7],)).fetchone()
+    return row[0] if row else None
+
+def day_rows(con, day: str, archived: bool) -> list:
+    # hot tier + mjesečna arhiva (ako je mjesec arhiviran, već je ATTACH-ana kao "arch"); isti id u oba -> hot red
+    sql = f"SELECT {SELECT_COLS} FROM {{db}}.departures WHERE service_date=?"
+    rows = con.execute(sql.format(db="arch"), (day,)).fetchall() if archived else []
+    rows += con.execute(sql.format(db="main"), (day,)).fetchall()
+    return sorted({r[0]: r for r in rows}.values(), key=lambda r: (r[4], r[6], r[0]))
+
+# =======================
+# Tijelo odgovora – revizija i redovi iz istog read snapshota, JSON se kodira jednom po (dan, rev)
+# =======================
+bodies, bodies_lock = OrderedDict(), threading.Lock()
+
+def snapshot(day: str) -> tuple:
+    con = conn()
+    file = archive_file(con, day)
+    while True:
+        if file:  # ATTACH ne ide unutar transakcije
+            con.execute("ATTACH DATABASE ? AS arch", (f"file:{os.path.abspath(os.path.join(ARCHIVE_DIR, file))}?mode=ro",))
+        try:
+            con.execute("BEGIN")
+            if (now := archive_file(con, day)) == file:
+                rev = day_revision(con, day)
+                with bodies_lock:
+                    cached = bodies.get((day, rev))
+                    if cached is not None: bodies.move_to_end((day, rev))
+                rows = None if cached is not None else day_rows(con, day, file is not None)
+        finally:
+            con.rollback()
+            if file: con.execute("DETACH DATABASE arch")
+        if now == file: break
+        file = now  # mjesec se arhivirao između provjere i BEGIN-a – ponovo, s arhivom
+    if cached is not None: return rev, cached
+    body = json.dumps({"date": day, "revision": rev, "generated_at": datetime.now().isoformat(timespec="seconds"),
+                       "departures": [dict(zip(COLS, r)) for r in rows]}, ensure_ascii=False).encode("utf-8")
+    with bodies_lock:
+        bodies[(day, rev)] = body
+        while len(bodies) > BODY_CACHE: bodies.popitem(last=False)
+    return rev, body
+
+def etag(day: str, rev: int) -> str:
+    return f'"{day}-{rev}"'
+
+def matches(header: str | None, tag: str) -> bool:
+    return header is not None and (header.strip() == "*" or tag in (t.strip() for t in header.split(",")))
+
+# =======================
+# Watcher – jedan thread za cijeli server; long-poll zahtjevi čekaju na Condition, ne na bazi
+# =======================
+class Watcher:
+    def __init__(self, poll: float):
+        self.poll, self.rev, self.cond = poll, 0, threading.Condition()
+
+    def run(self):
+        con = connect(DB_PATH)
+        while True:
+            try:
+                rev = data_revision(con)
+            except sqlite3.OperationalError:
+                rev = self.rev
+            if rev != self.rev:
+                with self.cond:
+                    self.rev = rev; self.cond.notify_all()
+            time.sleep(self.poll)
+
+    def wait_change(self, seen: int, timeout: float) -> int:
+        with self.cond:
+            self.cond.wait_for(lambda: self.rev != seen, timeout=timeout)
+            return self.rev
+
+watcher: Watcher | None = None
+
+# =======================
+# HTTP
+# =======================
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive – ploča drži jednu konekciju
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b"", tag: str | None = None):
+        self.send_response(status)
+        self.send_header("Cache-Control", "no-cache")  # preglednik uvijek revalidira preko ETag-a
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "ETag")
+        if tag: self.send_header("ETag", tag)
+        if body: self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body: self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/departures":
+            return self.send(404, b'{"error": "not found"}')
+        qs = parse_qs(url.query)
+        day = qs.get("date", [date.today().strftime("%Y-%m-%d")])[0]
+        try:
+            day = datetime.strptime(day, "%Y-%m-%d").strftime("%Y-%m-%d")
+            wait = min(float(qs.get("wait", ["0"])[0]), MAX_WAIT)
+        except ValueError:
+            return self.send(400, b'{"error": "date must be YYYY-MM-DD, wait a number of seconds"}')
+        known = self.headers.get("If-None-Match")
+        deadline = time.monotonic() + wait
+        seen = watcher.rev
+        rev = day_revision(conn(), day)
+        # long-poll: dok se dan nije promijenio, čekamo na watcher (budi se na svaku promjenu bilo kojeg dana)
+        while matches(known, etag(day, rev)) and (left := deadline - time.monotonic()) > 0:
+            seen = watcher.wait_change(seen, left)
+            rev = day_revision(conn(), day)
+        if matches(known, etag(day, rev)):
+            return self.send(304, tag=etag(day, rev))
+        rev, body = snapshot(day)
+        self.send(200, body, etag(day, rev))
+
+def main():
+    global DB_PATH, ARCHIVE_DIR, watcher
+    args = parse_args()
+    DB_PATH = args.db
+    ARCHIVE_DIR = os.environ.get("DEPARTURES_ARCHIVE_DIR", os.path.splitext(DB_PATH)[0] + "_archive")
+    watcher = Watcher(args.poll)
+    watcher.rev = data_revision(connect(DB_PATH))
+    threading.Thread(target=watcher.run, name="feed-watcher", daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"feed: http://{args.host}:{args.port}/departures  db={DB_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()